@@ -39,6 +39,16 @@ basic requirement for main loops. Implementations are
 from sage.rpc.core.transport import TransportError
 
 
+def fileno(fd):
+    """
+    Return the integer file descriptor of ``fd``
+    """
+    try:
+        return fd.fileno()
+    except AttributeError:
+        return fd
+
+
 
 class MainLoopABC(object):
 
@@ -56,7 +66,43 @@ class MainLoopABC(object):
         pass
 
     def add_rpc_clients(self, clients):
-        self._rpc_clients.extend(clients)
+        for client in clients:
+            self._rpc_clients.append(client)
+            self.rpc_client_added(client)
+
+    def remove_rpc_clients(self, clients):
+        for client in clients:
+            try:
+                self._rpc_clients.remove(client)
+            except ValueError:
+                continue
+            self.rpc_client_removed(client)
+
+    def rpc_client_added(self, client):
+        """
+        Hook that is called when a new RPC client is to be watched
+
+        Main loop implementations that register the client's file
+        descriptors with their event loop should override this
+        method.
+        """
+        pass
+
+    def rpc_client_removed(self, client):
+        """
+        Hook that is called when an RPC client is no longer watched
+        """
+        pass
+
+    def rpc_client_changed(self, client):
+        """
+        Hook that is called when the client's select arguments changed
+
+        This is called after the model sent a request to the client,
+        as the client might then want to be notified when its socket
+        becomes writable.
+        """
+        pass
 
     def run(self, debug=None):
         """
@@ -83,18 +129,57 @@ class MainLoopABC(object):
         """
         raise NotImplementedError
 
+    def call_later(self, seconds, callback, *args):
+        """
+        Call ``callback(*args)`` after a delay.
+
+        The callback is run from the main loop.
+
+        INPUT:
+
+        - ``seconds`` -- number. The delay in seconds.
+
+        - ``callback`` -- callable.
+        """
+        raise NotImplementedError
+
+    def rpc_client_select_args(self, client):
+        """
+        Return the select arguments of a single client
+
+        OUTPUT:
+
+        A triple ``(rlist, wlist, xlist)`` or ``None`` if the client's
+        transport failed. In the latter case, the client is no longer
+        watched.
+        """
+        try:
+            return client.select_args()
+        except TransportError:
+            self.remove_rpc_clients([client])
+            print('select_args TransportError', client)
+            return None
+
+    def rpc_client_handle(self, client, rlist, wlist, xlist):
+        """
+        Let a single client process its ready file descriptors
+        """
+        try:
+            client.select_handle(rlist, wlist, xlist)
+        except TransportError:
+            self.remove_rpc_clients([client])
+            print('select_handler TransportError', client)
+            client.close()
+
     def select_args(self):
-        idle = self._rpc_clients
         rlist = []
         wlist = []
         xlist = []
-        for obj in list(idle):
-            try:
-                rl, wl, xl = obj.select_args()
-            except TransportError:
-                idle.remove(obj)
-                print('select_args TransportError', obj)
+        for obj in list(self._rpc_clients):
+            args = self.rpc_client_select_args(obj)
+            if args is None:
                 continue
+            rl, wl, xl = args
             rlist += rl
             wlist += wl
             xlist += xl
@@ -103,13 +188,5 @@ class MainLoopABC(object):
     def select_handler(self, rlist, wlist, xlist):
         if rlist == [] and wlist == [] and xlist == []:
             return # timeout?
-        idle = self._rpc_clients
-        import select
-        #rlist, wlist, xlist = select.select(rlist, wlist, xlist, 0)
-        for obj in list(idle):
-            try:
-                obj.select_handle(rlist, wlist, xlist)
-            except TransportError:
-                idle.remove(obj)
-                print('select_handler TransportError', obj)
-                obj.close()
+        for obj in list(self._rpc_clients):
+            self.rpc_client_handle(obj, rlist, wlist, xlist)
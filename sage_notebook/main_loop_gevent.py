@@ -27,10 +27,81 @@ import logging
 logger = logging.getLogger('GUI')
 
 import gevent
-import gevent.select
-from .main_loop import MainLoopABC
+from gevent.event import Event
+from .main_loop import MainLoopABC, fileno
 
 
+# libev event masks for io watchers
+READ = 1
+WRITE = 2
+
+
+class RpcClientWatcher(object):
+
+    def __init__(self, main_loop, client):
+        """
+        The io watchers for the file descriptors of a single RPC client
+
+        The watchers are only replaced when the client's select
+        arguments change, see :meth:`arm`.
+
+        INPUT:
+
+        - ``main_loop`` -- the :class:`MainLoopGevent`.
+
+        - ``client`` -- the RPC client.
+        """
+        self._main_loop = main_loop
+        self._client = client
+        self._loop = gevent.get_hub().loop
+        self._watchers = dict()
+        self._rlist = []
+        self._wlist = []
+
+    @property
+    def client(self):
+        return self._client
+
+    def arm(self):
+        """
+        Start/stop watchers to match the client's select arguments
+        """
+        args = self._main_loop.rpc_client_select_args(self._client)
+        if args is None:
+            return   # client was removed
+        rlist, wlist, xlist = args
+        # libev has no exceptional conditions, transport errors
+        # show up as readable sockets.
+        interest = set((fd, READ) for fd in rlist)
+        interest.update((fd, WRITE) for fd in wlist)
+        for key in set(self._watchers).difference(interest):
+            self._watchers.pop(key).stop()
+        for key in interest.difference(self._watchers):
+            fd, events = key
+            watcher = self._loop.io(fileno(fd), events)
+            watcher.start(self._main_loop.on_io_event, self, key)
+            self._watchers[key] = watcher
+
+    def stop(self):
+        for watcher in self._watchers.values():
+            watcher.stop()
+        self._watchers = dict()
+
+    def add_ready(self, key):
+        fd, events = key
+        ready = self._rlist if events == READ else self._wlist
+        if fd not in ready:
+            ready.append(fd)
+
+    def dispatch(self):
+        """
+        Let the client process all file descriptors that became ready
+        """
+        rlist, self._rlist = self._rlist, []
+        wlist, self._wlist = self._wlist, []
+        self._main_loop.rpc_client_handle(self._client, rlist, wlist, [])
+        self._main_loop.rpc_client_changed(self._client)
+
 
 class MainLoopGevent(MainLoopABC):
 
@@ -38,6 +109,9 @@ class MainLoopGevent(MainLoopABC):
         super(MainLoopGevent, self).__init__()
         self._debug = None
         self._quit = False
+        self._rpc_watchers = dict()
+        self._ready = []
+        self._wakeup = Event()
 
     def run(self, debug=None):
         self._debug = debug
@@ -47,16 +121,48 @@ class MainLoopGevent(MainLoopABC):
     def run_forever(self):
         self._greenlet.join()
 
+    def call_later(self, seconds, callback, *args):
+        gevent.spawn_later(seconds, callback, *args)
+
+    def rpc_client_added(self, client):
+        watcher = RpcClientWatcher(self, client)
+        self._rpc_watchers[client] = watcher
+        watcher.arm()
+
+    def rpc_client_removed(self, client):
+        watcher = self._rpc_watchers.pop(client)
+        watcher.stop()
+
+    def rpc_client_changed(self, client):
+        try:
+            watcher = self._rpc_watchers[client]
+        except KeyError:
+            return
+        watcher.arm()
+
+    def on_io_event(self, watcher, key):
+        """
+        Callback from the io watchers.
+
+        This runs in the hub greenlet where we must not block, so we
+        only wake up the :meth:`loop` greenlet.
+        """
+        if watcher not in self._ready:
+            self._ready.append(watcher)
+        watcher.add_ready(key)
+        self._wakeup.set()
+
     def loop(self, debug=None):
         while not self._quit:
-            rlist, wlist, xlist = self.select_args()
-            rlist, wlist, xlist = gevent.select.select(rlist, wlist, xlist, 1)
-            # print('gevent loop', rlist, wlist, xlist)
-            self.select_handler(rlist, wlist, xlist)
+            self._wakeup.wait()
+            self._wakeup.clear()
+            ready, self._ready = self._ready, []
+            for watcher in ready:
+                watcher.dispatch()
         
     def quit(self):
         self._quit = True
-
-    def select_setup():
-        raise NotImplementedError
+        for watcher in self._rpc_watchers.values():
+            watcher.stop()
+        self._wakeup.set()
 
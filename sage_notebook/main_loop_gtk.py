@@ -29,9 +29,88 @@ logger = logging.getLogger('GUI')
 
 from gi.repository import GLib, GObject, Gtk
 
-from .main_loop import MainLoopABC
+from .main_loop import MainLoopABC, fileno
 
 
+IN = GLib.IOCondition.IN
+OUT = GLib.IOCondition.OUT
+ERR = GLib.IOCondition.ERR | GLib.IOCondition.HUP
+
+
+class RpcClientSource(GLib.Source):
+
+    def __init__(self, main_loop, client):
+        """
+        A GLib event source watching the file descriptors of a RPC client
+
+        The source is long-lived, file descriptors are added,
+        modified, and removed with :meth:`arm` whenever the client's
+        select arguments change.
+
+        INPUT:
+
+        - ``main_loop`` -- the :class:`MainLoopGtk`.
+
+        - ``client`` -- the RPC client.
+        """
+        GLib.Source.__init__(self)
+        self._main_loop = main_loop
+        self._client = client
+        self._fds = dict()
+
+    def arm(self):
+        """
+        Update the watched file descriptors to match the select arguments
+        """
+        args = self._main_loop.rpc_client_select_args(self._client)
+        if args is None:
+            return   # client was removed
+        rlist, wlist, xlist = args
+        interest = dict()
+        for fd in rlist:
+            interest.setdefault(fileno(fd), [fd, GLib.IOCondition(0)])[1] |= IN
+        for fd in wlist:
+            interest.setdefault(fileno(fd), [fd, GLib.IOCondition(0)])[1] |= OUT
+        for fd in xlist:
+            interest.setdefault(fileno(fd), [fd, GLib.IOCondition(0)])[1] |= ERR
+        for n in set(self._fds).difference(interest):
+            tag = self._fds.pop(n)[1]
+            self.remove_unix_fd(tag)
+        for n, (fd, condition) in interest.items():
+            try:
+                old_fd, tag, old_condition = self._fds[n]
+            except KeyError:
+                tag = self.add_unix_fd(n, condition)
+            else:
+                if condition != old_condition:
+                    self.modify_unix_fd(tag, condition)
+            self._fds[n] = (fd, tag, condition)
+
+    def prepare(self):
+        return False, -1
+
+    def check(self):
+        for fd, tag, condition in self._fds.values():
+            if self.query_unix_fd(tag) & (condition | ERR):
+                return True
+        return False
+
+    def dispatch(self, callback, args):
+        rlist = []
+        wlist = []
+        xlist = []
+        for fd, tag, condition in list(self._fds.values()):
+            ready = self.query_unix_fd(tag)
+            if ready & (IN | ERR) and condition & IN:
+                rlist.append(fd)
+            if ready & OUT and condition & OUT:
+                wlist.append(fd)
+            if ready & ERR and condition & ERR:
+                xlist.append(fd)
+        self._main_loop.rpc_client_handle(self._client, rlist, wlist, xlist)
+        self._main_loop.rpc_client_changed(self._client)
+        return True
+
 
 
 
@@ -41,7 +120,7 @@ class MainLoopGtk(MainLoopABC):
     def __init__(self):
         super(MainLoopGtk, self).__init__()
         self.context = GObject.main_context_default()
-        self.source = None
+        self._rpc_sources = dict()
 
     def debug_shell_gtk(self, app):
         from IPython.lib.inputhook import enable_gtk3
@@ -61,14 +140,6 @@ class MainLoopGtk(MainLoopABC):
         """
         Run the main loop.
         """
-        GObject.timeout_add(50, self.select_setup)
-        #self.select_setup()
-
-        #GObject.timeout_add(500, callback)
-        #loop = GLib.MainLoop()
-        #loop.run()
-        #return
-
         if debug is not None:
             self.debug_shell_gtk(debug)
         else:
@@ -83,81 +154,31 @@ class MainLoopGtk(MainLoopABC):
             Gtk.main()
 
     def quit(self):
-        if self.source is not None:
-            self.source.destroy()
+        for source in self._rpc_sources.values():
+            source.destroy()
+        self._rpc_sources = dict()
         Gtk.main_quit()
-    
-
-
-    def select_setup_new(self):
-        """
-        The newer implementation using GLib.Source.add_unix_fd()
-        
-        .. TODO::
-        
-            Too cutting edge right now, unfortunately. Implementation
-            is not complete.
-        """
-        #self.source.remove()
-        if self.source is not None:
-            self.source.destroy()
-        self.source = source = GLib.Source()
-
-        rlist, wlist, xlist = self.select_args()
-        print('select_setup', rlist, wlist, xlist)
-        fds = set(rlist + wlist + xlist)
-
-        # should use GLib.Source.add_unix_fd, but thats too cutting edge right now
-        assert len(fds) == 1
-        fd = next(iter(fds))
-
-        condition = GLib.IOCondition(0)
-        if fd in rlist:
-            condition |= GLib.IOCondition.IN
-        if fd in wlist:
-            condition |= GLib.IOCondition.OUT
-        if fd in xlist:
-            condition |= GLib.IOCondition.ERR
-        if condition.real != 0:
-            source.add_unix_fd(fd, condition)
 
-        source.set_callback(self.glib_select_callback, fd)
-        #source.attach(self.context)
+    def call_later(self, seconds, callback, *args):
+        def timeout_callback():
+            callback(*args)
+            return False
+        GLib.timeout_add(int(1000 * seconds), timeout_callback)
 
-
-    
-    def select_setup_old(self):
-        """
-        The older implementation using GLib.Source.add_poll()
-        """
-        rlist, wlist, xlist = self.select_args()
-        fds = set(rlist + wlist + xlist)
-        assert len(fds) == 1
-        fd = next(iter(fds))
-
-        condition = GLib.IOCondition(0)
-        if fd in rlist:
-            condition |= GLib.IOCondition.IN
-        if fd in wlist:
-            condition |= GLib.IOCondition.OUT
-        if fd in xlist:
-            condition |= GLib.IOCondition.ERR
-        source = GLib.unix_fd_source_new(fd, condition)
-        source.set_callback(self.glib_select_callback_old, (fd, rlist, wlist, xlist))
+    def rpc_client_added(self, client):
+        source = RpcClientSource(self, client)
+        self._rpc_sources[client] = source
         source.attach(self.context)
-        self.source = source
-
-    select_setup = select_setup_old
-                
-    def glib_select_callback_old(self, args):
-        fd, rlist, wlist, xlist = args
-        import select
-        rlist, wlist, xlist = select.select(rlist, wlist, xlist, 0)
-        if rlist == wlist == xlist == []:
-            pass
-        else:
-            self.select_handler(rlist, wlist, xlist)
-        self.select_setup()
-        return False
-
-
+        # arming may remove the client again, which destroys the source
+        source.arm()
+
+    def rpc_client_removed(self, client):
+        source = self._rpc_sources.pop(client)
+        source.destroy()
+
+    def rpc_client_changed(self, client):
+        try:
+            source = self._rpc_sources[client]
+        except KeyError:
+            return
+        source.arm()
@@ -0,0 +1,255 @@
+"""
+Ordered Sequence with Logarithmic Updates
+
+A Python list needs linear time to insert or remove an item, or to
+find the position of an item. The :class:`OrderStatisticTree` is a
+sequence of distinct hashable keys that supports all of these in
+logarithmic (expected) time. It is an implicit treap, that is, a
+randomized binary search tree ordered by position. Each node stores
+the size of its subtree to find nodes by position, and a parent
+pointer to compute the position of a node. A dictionary maps keys to
+their nodes.
+
+EXAMPLES::
+
+    sage: from sage_notebook.misc.order_statistic_tree import OrderStatisticTree
+    sage: t = OrderStatisticTree('abc')
+    sage: t.insert(1, 'x')
+    sage: t.insert(4, 'y')
+    sage: list(t)
+    ['a', 'x', 'b', 'c', 'y']
+    sage: t.index('c')
+    3
+    sage: t[1], t[-1]
+    ('x', 'y')
+    sage: t.remove('b')
+    sage: list(t), len(t)
+    (['a', 'x', 'c', 'y'], 4)
+    sage: 'b' in t
+    False
+    sage: t.index('b')
+    Traceback (most recent call last):
+    ...
+    ValueError: 'b' is not in the sequence
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import random
+
+
+class _Node(object):
+
+    __slots__ = ('key', 'priority', 'size', 'left', 'right', 'parent')
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+def _size(node):
+    return 0 if node is None else node.size
+
+
+def _set_left(node, child):
+    node.left = child
+    if child is not None:
+        child.parent = node
+
+
+def _set_right(node, child):
+    node.right = child
+    if child is not None:
+        child.parent = node
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node, n):
+    """
+    Split the subtree into the first ``n`` nodes and the rest
+    """
+    if node is None:
+        return (None, None)
+    node.parent = None
+    left_size = _size(node.left)
+    if n <= left_size:
+        left, right = _split(node.left, n)
+        _set_left(node, right)
+        _update(node)
+        return (left, node)
+    else:
+        left, right = _split(node.right, n - left_size - 1)
+        _set_right(node, left)
+        _update(node)
+        return (node, right)
+
+
+def _merge(left, right):
+    """
+    Concatenate two subtrees
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        _set_right(left, _merge(left.right, right))
+        _update(left)
+        left.parent = None
+        return left
+    else:
+        _set_left(right, _merge(left, right.left))
+        _update(right)
+        right.parent = None
+        return right
+
+
+class OrderStatisticTree(object):
+
+    def __init__(self, keys=()):
+        """
+        A sequence of distinct keys
+
+        INPUT:
+
+        - ``keys`` -- iterable. The initial keys. The tree is built in
+          linear time.
+        """
+        self._nodes = dict()
+        self._root = self._build(keys)
+
+    def _build(self, keys):
+        """
+        Build the treap in linear time
+
+        The rightmost path is kept on a stack, see the standard
+        construction of Cartesian trees.
+        """
+        nodes = self._nodes
+        stack = []
+        for key in keys:
+            if key in nodes:
+                raise ValueError('duplicate key {0!r}'.format(key))
+            node = nodes[key] = _Node(key, random.random())
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                _update(last)
+            _set_left(node, last)
+            if stack:
+                _set_right(stack[-1], node)
+            stack.append(node)
+        while len(stack) > 1:
+            _update(stack.pop())
+        if not stack:
+            return None
+        root = stack[0]
+        _update(root)
+        root.parent = None
+        return root
+
+    def __repr__(self):
+        return 'Order statistic tree with {0} keys'.format(len(self))
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def insert(self, pos, key):
+        """
+        Insert ``key`` before position ``pos``
+
+        Like :meth:`list.insert`, positions beyond the end append.
+        """
+        if key in self._nodes:
+            raise ValueError('duplicate key {0!r}'.format(key))
+        n = len(self)
+        if pos < 0:
+            pos = max(0, pos + n)
+        pos = min(pos, n)
+        node = self._nodes[key] = _Node(key, random.random())
+        left, right = _split(self._root, pos)
+        self._root = _merge(_merge(left, node), right)
+
+    def append(self, key):
+        self.insert(len(self), key)
+
+    def index(self, key):
+        """
+        Return the position of ``key``
+        """
+        try:
+            node = self._nodes[key]
+        except KeyError:
+            raise ValueError('{0!r} is not in the sequence'.format(key))
+        pos = _size(node.left)
+        while node.parent is not None:
+            parent = node.parent
+            if parent.right is node:
+                pos += _size(parent.left) + 1
+            node = parent
+        return pos
+
+    def remove(self, key):
+        """
+        Remove ``key`` from the sequence
+        """
+        pos = self.index(key)
+        del self._nodes[key]
+        left, right = _split(self._root, pos)
+        middle, right = _split(right, 1)
+        self._root = _merge(left, right)
+
+    def __getitem__(self, pos):
+        n = len(self)
+        if pos < 0:
+            pos += n
+        if not 0 <= pos < n:
+            raise IndexError('index out of range')
+        node = self._root
+        while True:
+            left_size = _size(node.left)
+            if pos < left_size:
+                node = node.left
+            elif pos == left_size:
+                return node.key
+            else:
+                pos -= left_size + 1
+                node = node.right
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.key
+                node = node.right
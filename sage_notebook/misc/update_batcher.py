@@ -0,0 +1,149 @@
+"""
+Coalesce Frequent Updates
+
+Some events, like output from a running computation, can arrive much
+faster than it makes sense to redraw the display. The
+:class:`UpdateBatcher` remembers the latest update for each key and
+flushes all pending updates at a fixed rate, or as soon as too many
+bytes have accumulated.
+
+EXAMPLES::
+
+    sage: from sage_notebook.misc.update_batcher import UpdateBatcher
+    sage: timers = []
+    sage: def call_later(seconds, callback):
+    ....:     timers.append(callback)
+    sage: def flush(item):
+    ....:     print('flush ' + item)
+    sage: batcher = UpdateBatcher(flush, call_later, interval=0.1, max_bytes=10)
+    sage: batcher.update('a', 'a1', 3)
+    sage: batcher.update('b', 'b1', 3)
+    sage: batcher.update('a', 'a2', 3)
+    sage: len(timers)
+    1
+    sage: timers.pop()()
+    flush a2
+    flush b1
+    sage: batcher.update('a', 'a3', 3)
+    sage: batcher.update('a', 'a4', 20)
+    flush a4
+    sage: batcher.update('a', 'a5', 3)
+    sage: batcher.update('b', 'b2', 1)
+    sage: batcher.pending_bytes
+    4
+    sage: batcher.discard('b')
+    sage: batcher.pending_bytes
+    3
+    sage: timers.pop()()
+    flush a5
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+from collections import OrderedDict
+
+
+class UpdateBatcher(object):
+
+    def __init__(self, flush_callback, call_later, interval=1.0/30, max_bytes=65536):
+        """
+        Merge pending updates per key and flush them periodically
+
+        INPUT:
+
+        - ``flush_callback`` -- callable. Will be called with each
+          pending item when flushing.
+
+        - ``call_later`` -- callable. ``call_later(seconds, callback)``
+          must arrange for ``callback()`` to be called after the given
+          number of seconds, see
+          :meth:`~sage_notebook.main_loop.MainLoopABC.call_later`.
+
+        - ``interval`` -- number. The time in seconds between
+          flushes.
+
+        - ``max_bytes`` -- integer. Flush immediately if the pending
+          updates amount to this many bytes.
+        """
+        self._flush_callback = flush_callback
+        self._call_later = call_later
+        self._interval = interval
+        self._max_bytes = max_bytes
+        self._pending = OrderedDict()
+        self._pending_bytes = 0
+        self._scheduled = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def pending_bytes(self):
+        """
+        The total size of the pending updates
+        """
+        return self._pending_bytes
+
+    def update(self, key, item, nbytes=0):
+        """
+        Schedule an update
+
+        INPUT:
+
+        - ``key`` -- hashable. Identifies the object being
+          updated. Pending updates with the same key are superseded.
+
+        - ``item`` -- anything. Will be passed to the flush callback.
+
+        - ``nbytes`` -- integer. The size of the update.
+        """
+        try:
+            key_bytes = self._pending[key][1] + nbytes
+        except KeyError:
+            key_bytes = nbytes
+        self._pending[key] = (item, key_bytes)
+        self._pending_bytes += nbytes
+        if self._pending_bytes >= self._max_bytes:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self._call_later(self._interval, self._on_timer)
+
+    def discard(self, key):
+        """
+        Forget about the pending update for ``key``, if any
+        """
+        try:
+            item, nbytes = self._pending.pop(key)
+        except KeyError:
+            return
+        self._pending_bytes -= nbytes
+
+    def flush(self):
+        """
+        Flush all pending updates now
+        """
+        pending = self._pending
+        self._pending = OrderedDict()
+        self._pending_bytes = 0
+        for item, nbytes in pending.values():
+            self._flush_callback(item)
+
+    def _on_timer(self):
+        self._scheduled = False
+        self.flush()
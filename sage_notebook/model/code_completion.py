@@ -5,19 +5,31 @@ EXAMPLES::
 
     sage: from sage_notebook.model.code_completion import Request
     sage: request = Request('x = pi.', int(4+3))
-    sage: request.input
+    sage: request.string
     'x = pi.'
     sage: request.pos
     7
+    sage: request.token
+    'pi.'
     sage: result = request.complete('pi.', ['N', 'Order', 'abs'])
     sage: result.request is request
     True
     sage: result.base
-    'pi.n'
+    'pi.'
     sage: result.completions
     ('N', 'Order', 'abs')
 """
 
+import collections
+import string
+
+
+# Characters that can be part of the expression that is being completed
+TOKEN_CHARS = frozenset(string.ascii_letters + string.digits + '_.')
+
+# Characters that extend an identifier without starting a new lookup
+IDENTIFIER_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
 
 class Request(object):
 
@@ -43,6 +55,25 @@ class Request(object):
     def pos(self):
         return self._pos
 
+    @property
+    def token(self):
+        """
+        The dotted expression in front of the cursor
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.code_completion import Request
+            sage: Request('factor(pi.ab', 12).token
+            'pi.ab'
+            sage: Request('1 + ', 4).token
+            ''
+        """
+        s = self._string[:self._pos]
+        start = len(s)
+        while start > 0 and s[start - 1] in TOKEN_CHARS:
+            start -= 1
+        return s[start:]
+
     def complete(self, base, completion):
         return Completion(self, base, completion)
 
@@ -66,3 +97,113 @@ class Completion(object):
     @property
     def completions(self):
         return self._completion
+
+
+
+class CompletionCache(object):
+
+    def __init__(self, maxsize=256):
+        """
+        Cache for code completion results
+
+        The completions only depend on the state of the compute
+        session, so they are cached by (session, evaluation counter,
+        expression in front of the cursor). Typing more identifier
+        characters only narrows down the completions, so the result
+        for ``pi.ab`` is derived from a cached result for ``pi.`` or
+        ``pi.a`` without asking the compute server.
+
+        INPUT:
+
+        - ``maxsize`` -- integer. The maximal number of cached
+          results. The least recently used one is dropped first.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.code_completion import Request, CompletionCache
+            sage: cache = CompletionCache()
+            sage: cache.put('session', 0, Request('pi.', 3), 'pi.', ['pi.N', 'pi.abs', 'pi.arccos'])
+            sage: cache.get('session', 0, Request('pi.a', 4))
+            ('pi.a', ('pi.abs', 'pi.arccos'))
+            sage: cache.get('session', 1, Request('pi.a', 4)) is None
+            True
+            sage: cache.get('session', 0, Request('pi.abs(', 7)) is None
+            True
+            sage: cache.clear()
+            sage: len(cache)
+            0
+        """
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Drop all cached results
+        """
+        self._entries.clear()
+
+    def put(self, session, counter, request, base, completions):
+        """
+        Store the completions for the request
+
+        INPUT:
+
+        - ``session`` -- hashable. Identifies the compute session.
+
+        - ``counter`` -- integer. The evaluation counter of the compute
+          session.
+
+        - ``request`` -- a :class:`Request`. The answered request.
+
+        - ``base``, ``completions`` -- the answer of the compute
+          server.
+        """
+        key = (session, counter, request.token)
+        self._entries.pop(key, None)
+        self._entries[key] = (base, tuple(completions))
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, session, counter, request):
+        """
+        Return the cached completions for the request
+
+        OUTPUT:
+
+        A pair ``(base, completions)`` or ``None`` if the request
+        cannot be answered from the cache.
+        """
+        token = request.token
+        if not token:
+            return None
+        end = len(token)
+        while end > 0:
+            key = (session, counter, token[:end])
+            try:
+                base, completions = self._entries.pop(key)
+            except KeyError:
+                pass
+            else:
+                self._entries[key] = (base, completions)
+                return self._narrow(token[:end], token[end:], base, completions)
+            if token[end - 1] not in IDENTIFIER_CHARS:
+                break
+            end -= 1
+        return None
+
+    def _narrow(self, token, extension, base, completions):
+        """
+        Filter the completions for ``token`` by the typed ``extension``
+
+        The completions replace ``base`` in front of the cursor, so
+        this only works if the base is the end of the token.
+        """
+        if not extension:
+            return (base, completions)
+        if not token.endswith(base):
+            return None
+        base += extension
+        return (base, tuple(c for c in completions if c.startswith(base)))
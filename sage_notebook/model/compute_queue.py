@@ -0,0 +1,209 @@
+"""
+Queue of Cells Waiting for Evaluation
+
+The compute server evaluates one cell at a time. The other cells wait
+in a priority queue, so that a cell that the user wants to see now
+can overtake a long batch of cells (like "evaluate all"). Cells with
+the same priority are evaluated in the order in which they were
+queued.
+
+The pending cells are kept in a binary heap. Cancelled cells are only
+marked as such and skipped when they reach the top of the heap, so
+all operations take logarithmic time.
+
+EXAMPLES::
+
+    sage: from sage_notebook.model.compute_queue import (
+    ....:     Queue, PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+    sage: q = Queue()
+    sage: for label in ['a', 'b', 'c']:
+    ....:     q.push(label, 'cell ' + label, PRIORITY_BATCH)
+    sage: q.current_label
+    'a'
+    sage: q.push('d', 'cell d', PRIORITY_INTERACTIVE)
+    sage: q
+    Queue running a, 3 pending
+    sage: q.pending_labels()
+    ['d', 'b', 'c']
+    sage: q.cancel('b')
+    'cell b'
+    sage: q.pop()
+    ('a', 'cell a')
+    sage: q.current_label
+    'd'
+    sage: q.push('c', 'cell c', PRIORITY_INTERACTIVE)
+    sage: q.pop(), q.pop(), q.pop()
+    (('d', 'cell d'), ('c', 'cell c'), (None, None))
+    sage: q.is_empty()
+    True
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import heapq
+import itertools
+import logging
+logger = logging.getLogger('GUI')
+
+
+# Smaller numbers are evaluated first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Placeholder for the label of cancelled heap entries
+_CANCELLED = object()
+
+
+class Queue(object):
+
+    def __init__(self):
+        """
+        The cell being evaluated and the cells waiting for evaluation
+        """
+        self._current_label = None
+        self._cells = dict()
+        self._heap = []
+        self._entries = dict()
+        self._counter = itertools.count()
+
+    def __repr__(self):
+        return 'Queue running {0}, {1} pending'.format(
+            self._current_label, len(self._entries))
+
+    def __getitem__(self, label):
+        return self._cells[label]
+
+    def __contains__(self, label):
+        return label in self._cells
+
+    def __len__(self):
+        return len(self._cells)
+
+    def is_empty(self):
+        return self._current_label is None
+
+    @property
+    def current_label(self):
+        return self._current_label
+
+    @property
+    def current_cell(self):
+        try:
+            return self._cells[self._current_label]
+        except KeyError:
+            return None
+
+    def pending_labels(self):
+        """
+        Return the labels of the pending cells in evaluation order
+
+        This sorts the heap, so it is only meant for debugging.
+        """
+        return [entry[2] for entry in sorted(self._heap)
+                if entry[2] is not _CANCELLED]
+
+    def push(self, label, cell, priority=PRIORITY_INTERACTIVE):
+        """
+        Queue ``cell`` for evaluation
+
+        If the label is already pending, its priority is changed
+        instead.
+
+        INPUT:
+
+        - ``label`` -- hashable. Identifies the queued evaluation.
+
+        - ``cell`` -- anything. The cell to evaluate.
+
+        - ``priority`` -- integer. Smaller numbers are evaluated
+          first.
+        """
+        if label == self._current_label:
+            raise ValueError('{0} is already being evaluated'.format(label))
+        if label in self._entries:
+            self._cancel_entry(label)
+        self._cells[label] = cell
+        if self._current_label is None:
+            self._current_label = label
+        else:
+            entry = [priority, next(self._counter), label]
+            self._entries[label] = entry
+            heapq.heappush(self._heap, entry)
+        logger.debug('queue push %s, %s pending', label, len(self._entries))
+
+    def _cancel_entry(self, label):
+        entry = self._entries.pop(label)
+        entry[2] = _CANCELLED
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            # drop cancelled entries once they dominate the heap
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def cancel(self, label):
+        """
+        Remove a pending cell from the queue
+
+        The cell that is currently being evaluated cannot be
+        cancelled.
+
+        OUTPUT:
+
+        The cell.
+        """
+        if label not in self._entries:
+            raise KeyError('{0} is not pending'.format(label))
+        self._cancel_entry(label)
+        cell = self._cells.pop(label)
+        logger.debug('queue cancel %s, %s pending', label, len(self._entries))
+        return cell
+
+    def cancel_pending(self):
+        """
+        Remove all pending cells from the queue
+
+        OUTPUT:
+
+        The list of removed cells in evaluation order.
+        """
+        cells = [self._cells.pop(label) for label in self.pending_labels()]
+        self._heap = []
+        self._entries = dict()
+        return cells
+
+    def pop(self):
+        """
+        Finish the current cell and start the next one
+
+        OUTPUT:
+
+        The label and cell that were being evaluated.
+        """
+        old_label, old_cell = self.current_label, self.current_cell
+        if old_label is not None:
+            del self._cells[old_label]
+        self._current_label = None
+        heap = self._heap
+        while heap:
+            label = heapq.heappop(heap)[2]
+            if label is not _CANCELLED:
+                del self._entries[label]
+                self._current_label = label
+                break
+        logger.debug('queue pop %s, %s pending', self._current_label, len(self._entries))
+        return (old_label, old_cell)
@@ -1,13 +1,15 @@
 """
 The compute service
 """
-import os
+import itertools
 import logging
 logger = logging.getLogger('GUI')
 
-from sage.rpc.core.transport import TransportListen
 from sage.rpc.core.monitor import MonitorClient
 
+from .compute_queue import Queue, PRIORITY_INTERACTIVE
+from .code_completion import CompletionCache
+
 
 
 class ComputeServiceClient(MonitorClient):
@@ -50,143 +52,205 @@ class ComputeServiceClient(MonitorClient):
         self.service._impl_code_completion_finished(base, completions, label)
 
 
+class IntrospectionClient(ComputeServiceClient):
+    """
+    Client for the side worker that only answers code completions
 
-class Queue(object):
+    The side worker does not evaluate cells, so it does not see the
+    variables defined in the worksheet. But it stays responsive while
+    the main compute process is busy.
+    """
 
-    def __init__(self):
-        self._current_label = None
-        self._cells = dict()
-        self._next = list()
+    def _impl_sage_eval_stdin(self, label):
+        pass
 
-    def __getitem__(self, label):
-        return self._cells[label]
+    def _impl_sage_eval_stdout(self, stdout, label):
+        pass
 
-    def is_empty(self):
-        return self._current_label is None
+    def _impl_sage_eval_stderr(self, stderr, label):
+        pass
 
-    @property
-    def current_label(self):
-        return self._current_label
+    def _impl_sage_eval_result(self, cpu_time, wall_time, label):
+        pass
 
-    @property
-    def current_cell(self):
-        try:
-            return self._cells[self._current_label]
-        except KeyError:
-            return None
+    def _impl_sage_eval_crash(self, label):
+        self.service._impl_introspection_crash()
 
-    def push(self, label, cell):
-        assert label not in self._cells
-        self._cells[label] = cell
-        self._next.append(label)
-        if self._current_label is None:
-            self._current_label = label
-        assert len(self._cells) == len(self._next)
-        print('queue push {0} {1}'.format(self._cells, self._next))
-
-    def pop(self):
-        old_label, old_cell = self.current_label, self.current_cell
-        if old_label is not None:
-            del self._cells[old_label]
-            self._next.remove(old_label)
-        if len(self._next) == 0:
-            self._current_label = None
-        else:
-            self._current_label = self._next[0]
-        print('queue pop {0} {1}'.format(self._cells, self._next))
-        assert len(self._cells) == len(self._next)
-        return (old_label, old_cell)
-        
 
 
+class ComputeService(object):
 
+    def __init__(self, presenter, monitor_pool):
+        """
+        The compute service
 
-class ComputeService(object):
+        INPUT:
 
-    def __init__(self, presenter):
+        - ``presenter`` -- the presenter. Receives the callbacks from
+          the compute server.
+
+        - ``monitor_pool`` -- a
+          :class:`~sage_notebook.model.monitor_pool.MonitorPool`. New
+          compute monitors are taken from it.
+        """
         self.presenter = presenter
+        self.monitor_pool = monitor_pool
         self.queue = Queue()
-        self.pending_completions = []
+        self.pending_completions = dict()
+        self.completion_cache = CompletionCache()
+        self.completion_delay = 0.08
+        self._completion_labels = itertools.count()
+        self._debounced_completions = dict()
+        self._latest_completions = dict()
+        self._monitor = None
+        self._client = None
+        self._side_monitor = None
+        self._side_client = None
+        self._interrupting = None
+        self.interrupt_timeout = 5
         self.start_client()
         from sage.rpc.core.logging_origin import logger
         logger.setLevel(logging.DEBUG)
 
     def start_client(self):
         self._eval_counter = 0
-        interface = 'localhost'
-        cookie = self._random_cookie()
-        uri = 'tcp://localhost:0'
-        transport = TransportListen(uri)
-        self._monitor = monitor = self._spawn_monitor(
-            cookie, transport.port(), interface)
-        transport.accept()
-        self._client = ComputeServiceClient(self, transport, cookie)
-        #client.wait_for_initialization()
-        #self._add_idle(client)        
-        #import time
-        #for i in range(200):
-        #    self._inputhook()
-        #    time.sleep(0.01)
-        
-    def restart_client(self):
-        self._eval_counter = 0
-        raise NotImplementedError
+        self.completion_cache.clear()
+        self._monitor = monitor = self.monitor_pool.take()
+        self._client = ComputeServiceClient(self, monitor.transport, monitor.cookie)
+        self.presenter.on_compute_client_started(self._client)
 
-    @property
-    def rpc_client(self):
-        return self._client
-
-    def _random_cookie(self, length=30):
+    def stop_client(self):
         """
-        Return a new random string.
-
-        OUTPUT:
-
-        A random string.
-
-        EXAMPLES::
-
-            sage: sage_remote.random_cookie()    # random output
-            'FayJpeGUjD7wg0tSqQGEpzupkWX1km'
+        Disconnect the client and stop its monitor process
         """
-        import string
-        import random
-        return ''.join(random.choice(string.ascii_letters + string.digits) 
-                       for x in range(length))
+        if self._client is not None:
+            self._drop_pending_completions(self._client)
+            self.presenter.on_compute_client_stopped(self._client)
+            self._client.close()
+            self._client = None
+        if self._monitor is not None:
+            self._monitor.terminate()
+            self._monitor = None
 
-    def _spawn_monitor(self, cookie, port, interface):
+    def restart_client(self):
         """
-        Create a server in a new process.
-
-        See :meth:`start_server` for a description of the input.
+        Replace the compute client with a fresh one from the pool
+        """
+        self.stop_client()
+        self.start_client()
 
-        OUTPUT:
+    def is_idle(self):
+        """
+        Whether no cell is being evaluated or waiting for evaluation
+        """
+        return self.queue.is_empty()
 
-        The subprocess running the server.
+    def shutdown(self):
+        """
+        Stop the compute session
         """
-        env = dict(os.environ)
-        env['COOKIE'] = cookie
-        cmd = ['sage', '-python', '-c',
-               'from sage.rpc.core.monitor import start_monitor; '
-               'start_monitor({0}, "{1}")'.format(port, interface)]
-        import sys
-        from subprocess import Popen
-        return Popen(cmd, env=env, stdout=sys.stdout, stderr=sys.stderr)
+        self._debounced_completions.clear()
+        self._latest_completions.clear()
+        self.stop_client()
+        self.stop_introspection()
+
+    @property
+    def rpc_client(self):
+        return self._client
 
     ####################################################
     #
     #  Evaluation of cells
 
-    def eval(self, cell):
+    def eval(self, cell, priority=PRIORITY_INTERACTIVE):
         """
         Start evaluating a notebook cell.
+
+        INPUT:
+
+        - ``cell`` -- the cell to evaluate.
+
+        - ``priority`` -- integer. Pending cells with smaller priority
+          are evaluated first, see
+          :mod:`~sage_notebook.model.compute_queue`. If the cell is
+          already waiting for evaluation, only its priority is
+          changed.
         """
+        if cell.id == self.queue.current_label:
+            logger.info('cell %s is already being evaluated', cell.id)
+            return
         ready = self.queue.is_empty()
-        cell.busy = True
-        self.queue.push(cell.id, cell)
+        if cell.id not in self.queue:
+            cell.busy = True
+        self.queue.push(cell.id, cell, priority)
         if ready:
             self._client.sage_eval(cell.input, cell.id)
+            self.presenter.on_compute_client_changed(self._client)
     
+    def cancel(self, cell_id):
+        """
+        Remove a cell that is waiting for evaluation from the queue
+
+        The cell is finished without output and with
+        :attr:`~sage_notebook.model.worksheet.Cell.interrupted` set,
+        like the cells that are dropped by :meth:`interrupt`.
+        """
+        cell = self.queue.cancel(cell_id)
+        self._finish(cell, interrupted=True)
+
+    def interrupt(self):
+        """
+        Interrupt the evaluation
+
+        The cell being evaluated is interrupted with SIGINT and the
+        pending cells are dropped from the queue. All of them are
+        finished with
+        :attr:`~sage_notebook.model.worksheet.Cell.interrupted`
+        set. The compute process (and its state) is kept unless it
+        does not react to the interrupt within
+        :attr:`interrupt_timeout` seconds, in which case it is
+        restarted.
+        """
+        for cell in self.queue.cancel_pending():
+            self._finish(cell, interrupted=True)
+        cell = self.queue.current_cell
+        if cell is None:
+            return
+        logger.info('interrupting cell %s', cell.id)
+        self._interrupting = cell.id
+        self._monitor.interrupt()
+        self.presenter.main_loop.call_later(
+            self.interrupt_timeout, self._check_interrupt, cell.id)
+
+    def _check_interrupt(self, cell_id):
+        """
+        Restart the compute process if the interrupt did not work
+        """
+        if self._interrupting != cell_id or self.queue.current_label != cell_id:
+            return
+        logger.warning('cell %s did not react to interrupt, restarting', cell_id)
+        self._interrupting = None
+        label, cell = self.queue.pop()
+        self.restart_client()
+        self._finish(cell, interrupted=True)
+        self._eval_next()
+
+    def _finish(self, cell, interrupted=False):
+        cell.busy = False
+        cell.interrupted = interrupted
+        if interrupted:
+            cell.index = None
+        self.presenter.on_evaluate_cell_finished(cell.id, cell)
+
+    def _eval_next(self):
+        """
+        Send the next cell in the queue to the compute server
+        """
+        next_cell = self.queue.current_cell
+        if next_cell is not None:
+            self._client.sage_eval(next_cell.input, next_cell.id)
+            self.presenter.on_compute_client_changed(self._client)
+
     def _impl_sage_eval_stdin(self, cell_id):
         """
         RPC callback when evaluation requests stdin
@@ -203,7 +267,7 @@ class ComputeService(object):
         assert cell.id == cell_id
         logger.debug('stdout %s', stdout.strip())
         cell.accumulate_stdout(stdout)
-        self.presenter.on_evaluate_cell_updated(cell_id, cell)
+        self.presenter.on_evaluate_cell_updated(cell_id, cell, len(stdout))
 
     def _impl_sage_eval_stderr(self, stderr, cell_id):
         """
@@ -213,38 +277,40 @@ class ComputeService(object):
         assert cell.id == cell_id
         logger.debug('stderr %s', stderr.strip())
         cell.accumulate_stderr(stderr)
-        self.presenter.on_evaluate_cell_updated(cell_id, cell)
+        self.presenter.on_evaluate_cell_updated(cell_id, cell, len(stderr))
 
     def _impl_sage_eval_result(self, cpu_time, wall_time, cell_id):
         """
         RPC callback when evaluation finished successfully
         """
         cell = self.queue.current_cell
-        cell.busy = False
-        cell.index = self._eval_counter
-        self._eval_counter += 1
         assert cell.id == cell_id
+        interrupted = (self._interrupting == cell_id)
+        if interrupted:
+            self._interrupting = None
+        else:
+            cell.index = self._eval_counter
+            self._eval_counter += 1
+        # even an interrupted cell may have changed the namespace
+        self.completion_cache.clear()
         self.queue.pop()
-        next_cell = self.queue.current_cell
-        if next_cell is not None:
-            self._client.sage_eval(next_cell.input, next_cell.id)
-        self.presenter.on_evaluate_cell_finished(cell_id, cell)
+        self._eval_next()
+        self._finish(cell, interrupted)
 
     def _impl_sage_eval_crash(self, cell_id):
         """
         RPC callback when the compute server crashed
         """
         cell = self.queue.current_cell
-        cell.busy = False
-        cell.index = None
         assert cell.id == cell_id
+        interrupted = (self._interrupting == cell_id)
+        self._interrupting = None
+        cell.index = None
         self.queue.pop()
-        self.presenter.on_evaluate_cell_finished(cell_id, cell)
+        self._finish(cell, interrupted)
         logger.warning('crashed')
         self.restart_client()
-        next_cell = self.queue.current_cell
-        if next_cell is not None:
-            self._client.sage_eval(next_cell.input, next_cell.id)
+        self._eval_next()
         
     ####################################################
     #
@@ -259,21 +325,168 @@ class ComputeService(object):
         - ``request`` -- a
           :class:`~sage_notebook.code_complete.Request` instance. The
           code completion request.
+
+        While a cell is being evaluated, the completion is handled by
+        a side worker (see :meth:`introspection_client`) instead of
+        waiting for the computation to finish. The side worker is only
+        started by the first such request, and until it has booted
+        the main compute process answers after the computation.
+
+        Requests that can be answered from :attr:`completion_cache`
+        are finished right away. Otherwise the request is only sent
+        once the cell did not ask for another completion for
+        :attr:`completion_delay` seconds, and a newer request for the
+        same cell supersedes the older ones.
         """
-        if not self.queue.is_empty():
+        if self._complete_from_cache(request):
             return
-        self.pending_completions.append(request)
-        self._client.code_complete(request.string, request.pos, request.label)
+        self._debounced_completions[request.cell_id] = request
+        self.presenter.main_loop.call_later(
+            self.completion_delay, self._send_completion, request)
+
+    def _complete_from_cache(self, request):
+        """
+        Finish the request if the answer is cached
+
+        The answers of the side worker are only used while a cell is
+        being evaluated, since the side worker does not know the
+        variables of the worksheet.
+
+        OUTPUT:
+
+        Boolean. Whether the request was answered.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.compute_service import ComputeService
+            sage: from sage_notebook.model.compute_queue import Queue
+            sage: from sage_notebook.model.code_completion import Request, CompletionCache
+            sage: class Presenter(object):
+            ....:     def code_complete_finished(self, completion):
+            ....:         print(completion.completions)
+            sage: service = ComputeService.__new__(ComputeService)   # no compute process
+            sage: service.presenter = Presenter()
+            sage: service.queue = Queue()
+            sage: service.completion_cache = CompletionCache()
+            sage: service._debounced_completions = dict()
+            sage: service._latest_completions = dict()
+            sage: service._client, service._side_client = 'main', 'side'
+            sage: service._eval_counter = 1
+            sage: service.queue.push('cell', 'x = matrix(...)')
+            sage: service.completion_cache.put('side', 0, Request('x.', 2), 'x.', ['x.conjugate'])
+            sage: service._complete_from_cache(Request('x.', 2))
+            ('x.conjugate',)
+            True
+            sage: _ = service.queue.pop()
+            sage: service._complete_from_cache(Request('x.', 2))
+            False
+        """
+        cached = self.completion_cache.get(self._client, self._eval_counter, request)
+        if (cached is None and self._side_client is not None and
+                not self.queue.is_empty()):
+            cached = self.completion_cache.get(self._side_client, 0, request)
+        if cached is None:
+            return False
+        self._debounced_completions.pop(request.cell_id, None)
+        self._latest_completions.pop(request.cell_id, None)
+        base, completions = cached
+        self.presenter.code_complete_finished(request.complete(base, completions))
+        return True
+
+    def _send_completion(self, request):
+        """
+        Send the request to the compute server unless it was superseded
+        """
+        if self._debounced_completions.get(request.cell_id) is not request:
+            return
+        del self._debounced_completions[request.cell_id]
+        if self._client is None:
+            return   # shut down
+        if self._complete_from_cache(request):
+            return
+        if self.queue.is_empty():
+            client = self._client
+            counter = self._eval_counter
+        else:
+            client = self.introspection_client()
+            if client is None:
+                # answered after the computation finished
+                client = self._client
+                counter = self._eval_counter
+            else:
+                counter = 0   # the side worker never evaluates anything
+        label = next(self._completion_labels)
+        self.pending_completions[label] = (request, client, counter)
+        self._latest_completions[request.cell_id] = label
+        client.code_complete(request.string, request.pos, label)
+        self.presenter.on_compute_client_changed(client)
+
+    def _drop_pending_completions(self, client):
+        """
+        Forget the completion requests that ``client`` will not answer
+        """
+        for label, pending in list(self.pending_completions.items()):
+            if pending[1] is client:
+                del self.pending_completions[label]
+
+    def introspection_client(self):
+        """
+        Return the client for code completion while the main compute
+        process is busy.
+
+        The side worker is taken from the monitor pool the first time
+        it is needed. Until it has connected, ``None`` is returned
+        instead of waiting for it to boot.
+        """
+        if self._side_client is not None:
+            return self._side_client
+        monitor = self._side_monitor
+        if monitor is None:
+            self._side_monitor = monitor = self.monitor_pool.take(wait=False)
+        if not monitor.is_alive():
+            logger.warning('code completion worker died while booting')
+            self.stop_introspection()
+            return None
+        if not monitor.is_connected():
+            logger.info('code completion worker is still booting')
+            return None
+        self._side_client = IntrospectionClient(self, monitor.transport, monitor.cookie)
+        self.presenter.on_compute_client_started(self._side_client)
+        return self._side_client
+
+    def stop_introspection(self):
+        """
+        Stop the side worker for code completion, if any
+        """
+        if self._side_client is not None:
+            self._drop_pending_completions(self._side_client)
+            self.presenter.on_compute_client_stopped(self._side_client)
+            self._side_client.close()
+            self._side_client = None
+        if self._side_monitor is not None:
+            self._side_monitor.terminate()
+            self._side_monitor = None
+
+    def _impl_introspection_crash(self):
+        logger.warning('code completion worker crashed')
+        self.stop_introspection()
         
     def _impl_code_completion_finished(self, base, completions, label):
         """
         Callback when autocomplete is finished
+
+        Replies to superseded requests only fill the cache, they are
+        not shown.
         """
-        while True:
-            if len(self.pending_completions) == 0:
-                raise RuntimeError('received code completion without outstanding request')
-            request = self.pending_completions.pop(0)
-            if request.label == label:
-                break
+        try:
+            request, client, counter = self.pending_completions.pop(label)
+        except KeyError:
+            logger.debug('ignoring code completion %s without request', label)
+            return
+        self.completion_cache.put(client, counter, request, base, completions)
+        if self._latest_completions.get(request.cell_id) != label:
+            logger.debug('ignoring stale code completion %s', label)
+            return
+        del self._latest_completions[request.cell_id]
         completion = request.complete(base, completions)
         self.presenter.code_complete_finished(completion)
@@ -0,0 +1,180 @@
+"""
+Compute Sessions
+
+Each worksheet gets its own compute session, that is, its own
+:class:`~sage_notebook.model.compute_service.ComputeService` with a
+separate Sage process. Independent worksheets can then be evaluated in
+parallel.
+
+The number of live sessions is limited. When the limit is reached,
+the least recently used idle session is shut down.
+
+EXAMPLES::
+
+    sage: from sage_notebook.model.compute_session import SessionManager
+    sage: class Service(object):
+    ....:     def __init__(self, name):
+    ....:         self.name = name
+    ....:         self.busy = False
+    ....:     def __repr__(self):
+    ....:         return 'Service ' + self.name
+    ....:     def is_idle(self):
+    ....:         return not self.busy
+    ....:     def shutdown(self):
+    ....:         print('shutdown ' + self.name)
+    sage: sessions = SessionManager(Service, max_sessions=2)
+    sage: sessions.get('a')
+    Service a
+    sage: sessions.get('b').busy = True
+    sage: sessions.get('a') is sessions.get('a')
+    True
+    sage: sessions.get('c')
+    shutdown a
+    Service c
+    sage: sorted(sessions.keys())
+    ['b', 'c']
+    sage: sessions['b']
+    Service b
+    sage: sessions['a']
+    Traceback (most recent call last):
+    ...
+    KeyError: 'a'
+    sage: sessions.rename('b', 'c')
+    shutdown c
+    sage: sessions.keys()
+    ['c']
+    sage: sessions['c']
+    Service b
+    sage: sessions.get('d')
+    Service d
+    sage: sessions.shutdown()
+    shutdown b
+    shutdown d
+    sage: len(sessions)
+    0
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import logging
+logger = logging.getLogger('GUI')
+
+from collections import OrderedDict
+
+
+class SessionManager(object):
+
+    def __init__(self, service_factory, max_sessions=4):
+        """
+        Map keys (usually worksheet identities) to compute sessions
+
+        INPUT:
+
+        - ``service_factory`` -- callable. Called with the key to
+          construct a new session. The returned object must implement
+          ``is_idle()`` and ``shutdown()``.
+
+        - ``max_sessions`` -- integer. The maximal number of live
+          sessions. Busy sessions are never shut down, so this limit
+          can be exceeded if all sessions are busy.
+        """
+        self._factory = service_factory
+        self._max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def __repr__(self):
+        return '{0} of at most {1} compute sessions'.format(
+            len(self), self._max_sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def keys(self):
+        return list(self._sessions.keys())
+
+    def __getitem__(self, key):
+        """
+        Return the session for ``key``
+
+        Unlike :meth:`get`, this neither starts a session nor changes
+        the order in which sessions are shut down.
+        """
+        return self._sessions[key]
+
+    def get(self, key):
+        """
+        Return the session for ``key``, starting it if necessary
+
+        The session becomes the most recently used one.
+        """
+        try:
+            session = self._sessions.pop(key)
+        except KeyError:
+            self._evict(self._max_sessions - 1)
+            session = self._factory(key)
+        self._sessions[key] = session
+        return session
+
+    def _evict(self, n_sessions):
+        """
+        Shut down least recently used idle sessions
+
+        INPUT:
+
+        - ``n_sessions`` -- integer. Try to shut down sessions until at
+          most this many are left.
+        """
+        for key, session in list(self._sessions.items()):
+            if len(self._sessions) <= n_sessions:
+                return
+            if session.is_idle():
+                self.stop(key)
+        if len(self._sessions) > n_sessions:
+            logger.warning('all %s compute sessions are busy', len(self._sessions))
+
+    def stop(self, key):
+        """
+        Shut down the session for ``key``
+        """
+        session = self._sessions.pop(key)
+        logger.info('shutting down compute session %s', session)
+        session.shutdown()
+
+    def rename(self, old_key, new_key):
+        """
+        Change the key of a session
+
+        A session that already has the new key is shut down. The
+        renamed session becomes the most recently used one.
+        """
+        if old_key == new_key:
+            return
+        if new_key in self._sessions:
+            self.stop(new_key)
+        self._sessions[new_key] = self._sessions.pop(old_key)
+
+    def shutdown(self):
+        """
+        Shut down all sessions
+        """
+        for key in self.keys():
+            self.stop(key)
@@ -97,5 +97,113 @@ class Config(object):
         self._data['window_geometry'] = value
         self._save()
 
+    @property
+    def compute_pool_size(self):
+        """
+        Number of idle compute monitors to keep booted
+        """
+        return self._data.get('compute_pool_size', 1)
+
+    @compute_pool_size.setter
+    def compute_pool_size(self, value):
+        self._data['compute_pool_size'] = value
+        self._save()
+
+    @property
+    def compute_pool_max_idle_age(self):
+        """
+        Seconds after which idle compute monitors are replaced
+        """
+        return self._data.get('compute_pool_max_idle_age', 3600)
+
+    @compute_pool_max_idle_age.setter
+    def compute_pool_max_idle_age(self, value):
+        self._data['compute_pool_max_idle_age'] = value
+        self._save()
+
+    @property
+    def compute_max_sessions(self):
+        """
+        Maximal number of worksheets with a live compute session
+        """
+        return self._data.get('compute_max_sessions', 4)
+
+    @compute_max_sessions.setter
+    def compute_max_sessions(self, value):
+        self._data['compute_max_sessions'] = value
+        self._save()
+
+    @property
+    def output_update_rate(self):
+        """
+        How often (per second) to redraw the output of running cells
+        """
+        return self._data.get('output_update_rate', 30)
+
+    @output_update_rate.setter
+    def output_update_rate(self, value):
+        self._data['output_update_rate'] = value
+        self._save()
+
+    @property
+    def output_update_bytes(self):
+        """
+        Redraw the output of running cells after this many new bytes
+        """
+        return self._data.get('output_update_bytes', 65536)
+
+    @output_update_bytes.setter
+    def output_update_bytes(self, value):
+        self._data['output_update_bytes'] = value
+        self._save()
+
+    @property
+    def output_max_bytes(self):
+        """
+        Output of a cell beyond this many characters is moved to disk
+        """
+        return self._data.get('output_max_bytes', 1000000)
+
+    @output_max_bytes.setter
+    def output_max_bytes(self, value):
+        self._data['output_max_bytes'] = value
+        self._save()
+
+    @property
+    def output_max_lines(self):
+        """
+        Output of a cell beyond this many lines is moved to disk
+        """
+        return self._data.get('output_max_lines', 10000)
+
+    @output_max_lines.setter
+    def output_max_lines(self, value):
+        self._data['output_max_lines'] = value
+        self._save()
+
         
     
+
+    @property
+    def autosave_interval(self):
+        """
+        Seconds between writing the worksheet journal to disk
+        """
+        return self._data.get('autosave_interval', 2)
+
+    @autosave_interval.setter
+    def autosave_interval(self, value):
+        self._data['autosave_interval'] = value
+        self._save()
+
+    @property
+    def autosave_compact_bytes(self):
+        """
+        Merge the journal into the worksheet file when it reaches this size
+        """
+        return self._data.get('autosave_compact_bytes', 1000000)
+
+    @autosave_compact_bytes.setter
+    def autosave_compact_bytes(self, value):
+        self._data['autosave_compact_bytes'] = value
+        self._save()
@@ -21,11 +21,16 @@ The Data Model and Backend
 ##############################################################################
 
 
+import os
 import logging
 
 
 from .config import Config
 from .compute_service import ComputeService
+from .compute_queue import PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from .compute_session import SessionManager
+from .monitor_pool import MonitorPool
+from .output_buffer import OutputLimits
 
 from .worksheet import Cell, Worksheet
 
@@ -36,15 +41,31 @@ class Model:
         self.presenter = presenter
         c = Config()
         self.config = c
-        self.compute = ComputeService(presenter)
+        self.output_limits = OutputLimits(c.output_max_bytes, c.output_max_lines,
+                                          c.notebooks_directory)
+        self.monitor_pool = MonitorPool(c.compute_pool_size, c.compute_pool_max_idle_age,
+                                        presenter.main_loop.call_later)
+        self.sessions = SessionManager(self._new_compute_service, c.compute_max_sessions)
         self.worksheet = None
+        self.journal = None
+
+    def _new_compute_service(self, identity):
+        return ComputeService(self.presenter, self.monitor_pool)
+
+    @property
+    def compute(self):
+        """
+        The compute session of the current worksheet
+        """
+        return self.sessions[self.worksheet.identity]
 
     def get_rpc_clients(self):
-        return [self.compute.rpc_client]
+        return [session.rpc_client for session in self.sessions]
 
     def terminate(self):
-        # save
-        pass
+        self._close_journal()
+        self.sessions.shutdown()
+        self.monitor_pool.shutdown()
 
     def get_sage_installation(self, sage_root):
         """
@@ -63,6 +84,17 @@ class Model:
     def get_cell(self, cell_id):
         return self.worksheet.get_cell(cell_id)
 
+    def set_cell_input(self, cell_id, input_string):
+        """
+        Store edited input of a cell that is not being evaluated
+        """
+        cell = self.get_cell(cell_id)
+        if cell.busy or cell.input == input_string:
+            return
+        if self.journal is not None:
+            self.journal.input(cell, input_string)
+        cell.input = input_string
+
     def insert_cell_at(self, pos, template_cell=None):
         """
         Insert and return the new cell
@@ -77,7 +109,8 @@ class Model:
         OUTPUT:
 
         The newly created cell (which is now at position ``pos``) is
-        returned.
+        returned. The presenter is notified with
+        :meth:`~sage_notebook.presenter.Presenter.on_cell_inserted`.
         """
         ws = self.worksheet
         if template_cell is None:
@@ -85,37 +118,229 @@ class Model:
         else:
             cell = template_cell.copy()
         ws.insert(pos, cell)
+        if self.journal is not None:
+            self.journal.insert(pos, cell)
+        self.presenter.on_cell_inserted(pos, cell)
         return cell
         
     def delete_cell(self, cell_id):
         """
         Delete the cell and return the cell that takes its place.
+
+        The presenter is notified with
+        :meth:`~sage_notebook.presenter.Presenter.on_cell_deleted`. A
+        worksheet always has at least one cell, so deleting the last
+        cell inserts a new empty one.
         """
         cell = self.get_cell(cell_id)
         ws = self.worksheet
         pos = ws.index(cell)
-        ws.delete(cell)
+        ws.remove(cell_id)
+        if self.journal is not None:
+            self.journal.delete(cell_id)
+        self.presenter.on_cell_deleted(pos, cell)
+        if ws.n_cells() == 0:
+            self.insert_cell_at(0)
         if pos == ws.n_cells():
             # deleted the last cell
             pos = ws.n_cells() - 1
         return ws[pos]
         
-    def load_worksheet(self):
-        self.worksheet = ws = Worksheet.create_default()
+    def move_cell(self, cell_id, pos):
+        """
+        Move the cell to position ``pos``
+
+        The presenter is notified with
+        :meth:`~sage_notebook.presenter.Presenter.on_cell_moved`.
+        """
+        ws = self.worksheet
+        cell = self.get_cell(cell_id)
+        old_pos = ws.index(cell)
+        if old_pos == pos:
+            return
+        ws.move(cell_id, pos)
+        if self.journal is not None:
+            self.journal.move(cell_id, pos)
+        self.presenter.on_cell_moved(old_pos, pos, cell)
+
+    def _open_journal(self, worksheet):
+        """
+        Start journaling changes to the saved ``worksheet``
+        """
+        from .worksheet_journal import Journal
+        c = self.config
+        self.journal = Journal(worksheet.filename, self.presenter.main_loop.call_later,
+                               c.autosave_interval, c.autosave_compact_bytes,
+                               seq=worksheet.journal_seq)
+
+    def _close_journal(self):
+        """
+        Write all pending journal entries to disk
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def new_worksheet(self):
+        """
+        Make a new, unsaved worksheet the current one
+        """
+        self._close_journal()
+        self.worksheet = ws = Worksheet.create_default(self.output_limits)
+        self.sessions.get(ws.identity)
+        return ws
+
+    def load_worksheet(self, filename=None):
+        """
+        Load a worksheet and make it the current one
+
+        INPUT:
+
+        - ``filename`` -- string or ``None`` (default). The worksheet
+          file to open. A new worksheet is created if not specified.
+
+        OUTPUT:
+
+        The :class:`~sage_notebook.model.worksheet.Worksheet`. Its
+        cells are read from the file on demand. Changes that were not
+        yet merged into the file are recovered from the journal.
+        """
+        if filename is None:
+            return self.new_worksheet()
+        from .worksheet_file import WorksheetFile
+        from .worksheet_journal import Journal
+        # the journal may belong to the same file, write it out first
+        self._close_journal()
+        try:
+            ws = Worksheet(WorksheetFile(filename), self.output_limits)
+        except Exception:
+            if self.worksheet is not None and self.worksheet.filename is not None:
+                self._open_journal(self.worksheet)
+            raise
+        n_entries = Journal.replay(ws)
+        if n_entries > 0:
+            logging.info('recovered %s journal entries for %s', n_entries, filename)
+        self._open_journal(ws)
+        if ws.n_cells() == 0:
+            cell = Cell()
+            ws.append(cell)
+            self.journal.insert(0, cell)
+        self.worksheet = ws
+        # re-opening a file reuses its session
+        self.sessions.get(ws.identity)
         return ws
 
+    def get_worksheet_extension(self):
+        from .worksheet_file import EXTENSION
+        return EXTENSION
+
+    def save_worksheet(self, filename=None):
+        """
+        Save the current worksheet
+
+        INPUT:
+
+        - ``filename`` -- string or ``None`` (default). The file name
+          to save to. By default, the file that the worksheet was
+          loaded from or last saved to.
+
+        The journal is discarded, since all changes are now in the
+        worksheet file. When saving to a different file, a journal
+        left over from an earlier worksheet with that file name is
+        deleted as well, and the compute session moves to the new
+        file name.
+        """
+        from .worksheet_journal import Journal
+        ws = self.worksheet
+        identity = ws.identity
+        journal = self.journal
+        if journal is not None:
+            journal.close()
+            ws.journal_seq = journal.seq
+        if filename is not None and os.path.abspath(filename) != identity:
+            Journal.remove_files(filename)
+        ws.save(filename)
+        self.sessions.rename(identity, ws.identity)
+        if journal is not None:
+            journal.discard()
+        self._open_journal(ws)
+
+    def is_current_cell(self, cell):
+        """
+        Whether ``cell`` belongs to the currently displayed worksheet
+        """
+        return self.worksheet is not None and cell in self.worksheet
+
     # Evaluation of cells
 
-    def eval_cell_init(self, cell_id, input_string):
+    def eval_cell_init(self, cell_id, input_string, priority=PRIORITY_INTERACTIVE):
         """
         Prepare the cell for evaluation
+
+        INPUT:
+
+        - ``cell_id`` -- the id of the cell to evaluate.
+
+        - ``input_string`` -- string. The new input of the cell.
+
+        - ``priority`` -- integer. Cells with smaller priority are
+          evaluated first, see
+          :mod:`~sage_notebook.model.compute_queue`.
         """
         cell = self.get_cell(cell_id)
+        if self.journal is not None and cell.input != input_string:
+            self.journal.input(cell, input_string)
         cell.input = input_string
         cell.index = None
-        self.compute.eval(cell)
+        self.compute.eval(cell, priority)
         return cell
 
+    def eval_all_init(self):
+        """
+        Queue all cells with input for evaluation
+
+        The cells are queued with batch priority, so cells that are
+        evaluated individually run first.
+
+        OUTPUT:
+
+        The list of queued cells.
+        """
+        cells = [cell for cell in self.worksheet if cell.input.strip()]
+        for cell in cells:
+            self.compute.eval(cell, PRIORITY_BATCH)
+        return cells
+
+    def eval_interrupt(self):
+        """
+        Interrupt the computation of the current worksheet
+
+        The running cell is interrupted and all waiting cells are
+        dropped, but the compute session is kept.
+        """
+        self.compute.interrupt()
+
+    def eval_cell_cancel(self, cell_id):
+        """
+        Remove a cell from the evaluation queue
+
+        OUTPUT:
+
+        Boolean. Whether the cell was waiting for evaluation. The cell
+        that is currently being evaluated cannot be cancelled.
+        """
+        try:
+            self.compute.cancel(cell_id)
+        except KeyError:
+            return False
+        return True
+
+    def load_elided_output(self, cell_id):
+        """
+        Return the part of the cell's output that was moved to disk
+        """
+        return self.get_cell(cell_id).output.load_elided()
+
     def eval_cell_update(self, cell):
         """
         We got partial output for ``cell``.
@@ -126,7 +351,8 @@ class Model:
         """
         Evaluation finished
         """
-        pass
+        if self.journal is not None and self.is_current_cell(cell):
+            self.journal.output(cell)
 
     # autocompletion
 
@@ -0,0 +1,341 @@
+"""
+Pool of Pre-Warmed Compute Monitors
+
+Starting a compute monitor means running ``sage -python`` and
+importing the Sage library, which takes several seconds. The
+:class:`MonitorPool` keeps a number of idle monitors booting in the
+background so that a new compute client (e.g., after a crash) can be
+connected almost instantly.
+
+The monitor processes are started with :class:`subprocess.Popen`,
+which does not block. They boot concurrently with the notebook and
+connect back to our listening transport as soon as they are
+ready. Taking a monitor from the pool then only has to accept the
+(usually already pending) connection.
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import os
+import sys
+import time
+import signal
+import select
+import logging
+logger = logging.getLogger('GUI')
+
+from sage.rpc.core.transport import TransportListen
+
+
+def random_cookie(length=30):
+    """
+    Return a new random string.
+
+    OUTPUT:
+
+    A random string.
+
+    EXAMPLES::
+
+        sage: from sage_notebook.model.monitor_pool import random_cookie
+        sage: random_cookie()    # random output
+        'FayJpeGUjD7wg0tSqQGEpzupkWX1km'
+    """
+    import string
+    import random
+    return ''.join(random.choice(string.ascii_letters + string.digits)
+                   for x in range(length))
+
+
+class WarmMonitor(object):
+
+    def __init__(self, interface='localhost'):
+        """
+        A monitor process together with its listening transport
+
+        The monitor process is spawned immediately, but we do not
+        wait for it to connect back. Use :meth:`accept` for that.
+
+        INPUT:
+
+        - ``interface`` -- string. The interface to listen on.
+        """
+        self._cookie = random_cookie()
+        self._transport = TransportListen('tcp://{0}:0'.format(interface))
+        self._process = self._spawn(self._transport.port(), interface)
+        self._created = time.time()
+        self._accepted = False
+
+    def _spawn(self, port, interface):
+        """
+        Create a monitor in a new process.
+
+        OUTPUT:
+
+        The subprocess running the monitor.
+        """
+        env = dict(os.environ)
+        env['COOKIE'] = self._cookie
+        cmd = ['sage', '-python', '-c',
+               'from sage.rpc.core.monitor import start_monitor; '
+               'start_monitor({0}, "{1}")'.format(port, interface)]
+        from subprocess import Popen
+        return Popen(cmd, env=env, stdout=sys.stdout, stderr=sys.stderr)
+
+    def __repr__(self):
+        return 'Monitor pid {0}'.format(self.pid)
+
+    @property
+    def cookie(self):
+        return self._cookie
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def process(self):
+        return self._process
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def age(self):
+        """
+        Return the number of seconds since the monitor was spawned
+        """
+        return time.time() - self._created
+
+    def is_alive(self):
+        """
+        Whether the monitor process is still running
+        """
+        return self._process.poll() is None
+
+    def is_connected(self):
+        """
+        Whether the monitor has connected back
+
+        Unlike :meth:`accept`, this never waits for the monitor
+        process to finish booting.
+        """
+        if not self._accepted:
+            readable, _, _ = select.select([self._transport], [], [], 0)
+            if not readable:
+                return False
+            self.accept()
+        return True
+
+    def accept(self):
+        """
+        Wait for the monitor to connect back.
+
+        This blocks until the monitor process has finished booting.
+        """
+        if not self._accepted:
+            self._transport.accept()
+            self._accepted = True
+        return self._transport
+
+    def interrupt(self):
+        """
+        Send SIGINT to the monitor process
+
+        The monitor interrupts the computation in progress, like
+        pressing Ctrl-C in the Sage command line.
+        """
+        if self.is_alive():
+            self._process.send_signal(signal.SIGINT)
+
+    def terminate(self):
+        """
+        Stop the monitor process and close its transport
+
+        EXAMPLES::
+
+            sage: import subprocess
+            sage: from sage_notebook.model.monitor_pool import WarmMonitor
+            sage: class SleepingMonitor(WarmMonitor):
+            ....:     def _spawn(self, port, interface):
+            ....:         return subprocess.Popen(['sleep', '60'])
+            sage: monitor = SleepingMonitor()
+            sage: monitor.terminate()
+            sage: monitor.is_alive(), monitor.transport
+            (False, None)
+            sage: monitor.terminate()
+        """
+        if self.is_alive():
+            self._process.terminate()
+        self._process.wait()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+class MonitorPool(object):
+
+    def __init__(self, size=1, max_idle_age=3600, call_later=None):
+        """
+        Keep a number of idle compute monitors ready to connect to
+
+        INPUT:
+
+        - ``size`` -- integer. The number of idle monitors to keep
+          booted.
+
+        - ``max_idle_age`` -- number. Idle monitors older than this
+          many seconds are replaced by fresh ones.
+
+        - ``call_later`` -- callable or ``None``. If specified,
+          ``call_later(seconds, callback)`` must arrange for
+          ``callback()`` to be called after the given number of
+          seconds, see
+          :meth:`~sage_notebook.main_loop.MainLoopABC.call_later`. It
+          is used to replace aged monitors in the background, before
+          they are needed.
+        """
+        self._size = size
+        self._max_idle_age = max_idle_age
+        self._call_later = call_later
+        self._maintenance_interval = max_idle_age / 4.0
+        self._idle = []
+        self.hits = 0
+        self.misses = 0
+        self.refill()
+        self._schedule_maintenance()
+
+    def __repr__(self):
+        return 'Monitor pool with {0} idle of {1} (hits={2}, misses={3})'.format(
+            len(self._idle), self._size, self.hits, self.misses)
+
+    @property
+    def size(self):
+        return self._size
+
+    def n_idle(self):
+        return len(self._idle)
+
+    def is_healthy(self, monitor, margin=0):
+        """
+        Health check for idle monitors
+
+        INPUT:
+
+        - ``monitor`` -- a :class:`WarmMonitor`.
+
+        - ``margin`` -- number. Treat the monitor as this many seconds
+          older.
+
+        OUTPUT:
+
+        Boolean. Whether the monitor process is still running and not
+        older than the maximal idle age.
+        """
+        return monitor.is_alive() and monitor.age() + margin < self._max_idle_age
+
+    def prune(self, margin=0):
+        """
+        Remove unhealthy idle monitors from the pool
+
+        INPUT:
+
+        - ``margin`` -- number. Also remove the monitors that will
+          exceed the maximal idle age within this many seconds.
+        """
+        healthy = []
+        for monitor in self._idle:
+            if self.is_healthy(monitor, margin):
+                healthy.append(monitor)
+            else:
+                logger.info('discarding idle %s', monitor)
+                monitor.terminate()
+        self._idle = healthy
+
+    def refill(self, margin=0):
+        """
+        Spawn new monitors until the pool is full again.
+
+        This does not block, the new monitors boot in the background.
+
+        INPUT:
+
+        - ``margin`` -- number. See :meth:`prune`.
+        """
+        self.prune(margin)
+        while len(self._idle) < self._size:
+            monitor = WarmMonitor()
+            logger.debug('spawned idle %s', monitor)
+            self._idle.append(monitor)
+
+    def take(self, wait=True):
+        """
+        Return a connected monitor
+
+        INPUT:
+
+        - ``wait`` -- boolean (default: ``True``). Whether to wait
+          until the monitor has connected. Otherwise, the monitor may
+          still be booting, see :meth:`WarmMonitor.is_connected`.
+
+        OUTPUT:
+
+        A :class:`WarmMonitor` whose transport is connected, unless
+        ``wait`` is false. If no healthy idle monitor is available, a
+        new one is spawned.
+        """
+        self.prune()
+        connected = [m for m in self._idle if m.is_connected()]
+        if len(connected) > 0:
+            monitor = connected[0]
+            self._idle.remove(monitor)
+            self.hits += 1
+        elif len(self._idle) > 0:
+            # still booting, but closer to being ready than a new one
+            monitor = self._idle.pop(0)
+            self.misses += 1
+        else:
+            monitor = WarmMonitor()
+            self.misses += 1
+        self.refill()
+        if wait:
+            monitor.accept()
+        return monitor
+
+    def _schedule_maintenance(self):
+        if self._call_later is not None:
+            self._call_later(self._maintenance_interval, self._on_maintenance_timer)
+
+    def _on_maintenance_timer(self):
+        """
+        Replace idle monitors that died or will soon be too old
+        """
+        if self._call_later is None:
+            return   # shut down
+        self.refill(margin=self._maintenance_interval)
+        self._schedule_maintenance()
+
+    def shutdown(self):
+        """
+        Stop all idle monitors
+        """
+        self._call_later = None
+        for monitor in self._idle:
+            monitor.terminate()
+        self._idle = []
@@ -0,0 +1,515 @@
+r"""
+Output Buffer for Cells
+
+The output of a cell arrives in many small chunks. Concatenating
+strings would copy the whole output for every chunk, so instead we
+store the list of chunks and only join them when necessary. Stdout and
+stderr are kept in the order in which they arrived.
+
+The amount of output kept in memory is limited, see
+:class:`OutputLimits`. Only the head and the tail of a huge
+output are kept, the middle is spilled to a temporary file and can be
+loaded on demand with :meth:`OutputBuffer.load_elided`.
+
+EXAMPLES::
+
+    sage: from sage_notebook.model.output_buffer import OutputBuffer, STDERR
+    sage: buf = OutputBuffer()
+    sage: buf.append('abc')
+    sage: buf.append('Error', STDERR)
+    sage: buf.append('def\n')
+    sage: len(buf)
+    12
+    sage: buf.getvalue()
+    'abcErrordef\n'
+    sage: buf.get(2, 5)
+    'cEr'
+    sage: buf.get(9)
+    'ef\n'
+    sage: buf.stream()
+    'abcdef\n'
+    sage: buf.stream(STDERR)
+    'Error'
+    sage: buf.stripped_size()
+    11
+
+Output beyond the limits is elided::
+
+    sage: from sage_notebook.model.output_buffer import OutputLimits
+    sage: buf = OutputBuffer(OutputLimits(max_bytes=None, max_lines=4))
+    sage: for i in range(10):
+    ....:     buf.append('line {0}\n'.format(i))
+    sage: buf.is_elided()
+    True
+    sage: buf.elided_lines
+    6
+    sage: print(buf.head())
+    line 0
+    line 1
+    sage: print(buf.tail_region())
+    line 8
+    line 9
+    sage: buf.tail_offset == len(buf) - len(buf.tail_region())
+    True
+    sage: print(buf.load_elided())
+    line 2
+    line 3
+    line 4
+    line 5
+    line 6
+    line 7
+    sage: len(buf) == len(buf.getvalue())
+    True
+    sage: buf.get(10, 20)
+    'e 1\nline 2'
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import mmap
+import tempfile
+from bisect import bisect_right
+from collections import deque
+
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+# Adjacent chunks from the same stream are merged up to this length
+CHUNK_SIZE = 4096
+
+
+def _cut(text, max_bytes, max_lines):
+    """
+    Return the length of the longest prefix within the limits
+
+    INPUT:
+
+    - ``text`` -- string.
+
+    - ``max_bytes`` -- integer or ``None``. The maximal length of the
+      prefix.
+
+    - ``max_lines`` -- integer or ``None``. The maximal number of
+      lines in the prefix. The prefix ends after the last newline
+      if the limit is reached.
+    """
+    pos = len(text)
+    if max_bytes is not None:
+        pos = min(pos, max(0, max_bytes))
+    if max_lines is not None:
+        if max_lines <= 0:
+            return 0
+        newline = -1
+        for i in range(max_lines):
+            newline = text.find('\n', newline + 1, pos)
+            if newline == -1:
+                return pos
+        pos = newline + 1
+    return pos
+
+
+def _half(limit):
+    if limit is None:
+        return (None, None)
+    head = limit // 2
+    return (head, limit - head)
+
+
+class OutputLimits(object):
+
+    def __init__(self, max_bytes=1000000, max_lines=10000, spill_directory=None):
+        """
+        The limits for the output of a cell that is kept in memory
+
+        Half of the limit is used for the head and half for the tail
+        of the output.
+
+        INPUT:
+
+        - ``max_bytes`` -- integer or ``None`` (no limit). The
+          maximal number of characters per cell.
+
+        - ``max_lines`` -- integer or ``None`` (no limit). The maximal
+          number of lines per cell.
+
+        - ``spill_directory`` -- string or ``None`` (the default
+          temporary directory). Where to store the elided output.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.output_buffer import OutputLimits
+            sage: OutputLimits(max_bytes=None)
+            Output limits of None characters and 10000 lines
+        """
+        self._max_bytes = max_bytes
+        self._max_lines = max_lines
+        self.head_max_bytes, self.tail_max_bytes = _half(max_bytes)
+        self.head_max_lines, self.tail_max_lines = _half(max_lines)
+        self.spill_directory = spill_directory
+
+    def __repr__(self):
+        return 'Output limits of {0} characters and {1} lines'.format(
+            self._max_bytes, self._max_lines)
+
+
+DEFAULT_LIMITS = OutputLimits()
+
+
+class OutputBuffer(object):
+
+    def __init__(self, limits=DEFAULT_LIMITS):
+        """
+        Append-only storage for the output of a cell
+
+        INPUT:
+
+        - ``limits`` -- an :class:`OutputLimits`. How much of the
+          output is kept in memory.
+        """
+        self._limits = limits
+        # the head
+        self._chunks = []
+        self._streams = []
+        self._offsets = []
+        self._size = 0
+        self._lines = 0
+        self._head_full = False
+        self._joined = None
+        # the elided middle, with a sparse index of character and
+        # byte offsets where the utf-8 encoded spill file can be cut
+        self._spill = None
+        self._spill_size = 0
+        self._spill_bytes = 0
+        self._spill_lines = 0
+        self._spill_index_chars = []
+        self._spill_index_bytes = []
+        # the tail, a list of [stream, text] pairs
+        self._tail = deque()
+        self._tail_size = 0
+        self._tail_lines = 0
+
+    def __repr__(self):
+        return 'Output buffer with {0} characters in {1} chunks'.format(
+            len(self), len(self._chunks) + len(self._tail))
+
+    def __len__(self):
+        return self._size + self._spill_size + self._tail_size
+
+    def append(self, text, stream=STDOUT):
+        """
+        Append output
+
+        INPUT:
+
+        - ``text`` -- string. The new output.
+
+        - ``stream`` -- either ``STDOUT`` (default) or ``STDERR``.
+        """
+        if len(text) == 0:
+            return
+        if not self._head_full:
+            limits = self._limits
+            pos = _cut(text, limits.head_max_bytes - self._size
+                       if limits.head_max_bytes is not None else None,
+                       limits.head_max_lines - self._lines
+                       if limits.head_max_lines is not None else None)
+            self._append_head(text[:pos], stream)
+            text = text[pos:]
+            if len(text) == 0:
+                return
+            self._head_full = True
+        self._append_tail(text, stream)
+
+    def _append_head(self, text, stream):
+        if len(text) == 0:
+            return
+        self._joined = None
+        chunks = self._chunks
+        if chunks and self._streams[-1] == stream and \
+           len(chunks[-1]) + len(text) <= CHUNK_SIZE:
+            chunks[-1] += text
+        else:
+            chunks.append(text)
+            self._streams.append(stream)
+            self._offsets.append(self._size)
+        self._size += len(text)
+        self._lines += text.count('\n')
+
+    def _append_tail(self, text, stream):
+        tail = self._tail
+        if tail and tail[-1][0] == stream and \
+           len(tail[-1][1]) + len(text) <= CHUNK_SIZE:
+            tail[-1][1] += text
+        else:
+            tail.append([stream, text])
+        self._tail_size += len(text)
+        self._tail_lines += text.count('\n')
+        limits = self._limits
+        while True:
+            excess_bytes = 0
+            if limits.tail_max_bytes is not None:
+                excess_bytes = self._tail_size - limits.tail_max_bytes
+            excess_lines = 0
+            if limits.tail_max_lines is not None:
+                excess_lines = self._tail_lines - limits.tail_max_lines
+            if excess_bytes <= 0 and excess_lines <= 0:
+                return
+            text = tail[0][1]
+            pos = max(excess_bytes, 0)
+            if excess_lines > 0:
+                pos = max(pos, _cut(text, None, excess_lines))
+            pos = min(pos, len(text))
+            self._spill_text(text[:pos])
+            if pos == len(text):
+                tail.popleft()
+            else:
+                tail[0][1] = text[pos:]
+
+    def _spill_text(self, text):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(
+                prefix='output-', dir=self._limits.spill_directory)
+        if not self._spill_index_bytes or \
+           self._spill_bytes - self._spill_index_bytes[-1] >= CHUNK_SIZE:
+            self._spill_index_chars.append(self._spill_size)
+            self._spill_index_bytes.append(self._spill_bytes)
+        data = text.encode('utf-8')
+        self._spill.write(data)
+        self._spill_bytes += len(data)
+        self._spill_size += len(text)
+        self._spill_lines += text.count('\n')
+        self._tail_size -= len(text)
+        self._tail_lines -= text.count('\n')
+
+    def is_elided(self):
+        """
+        Whether part of the output was moved to disk
+        """
+        return self._spill_size > 0
+
+    @property
+    def elided_lines(self):
+        """
+        The number of newlines in the elided part of the output
+        """
+        return self._spill_lines
+
+    def load_elided(self):
+        """
+        Return the elided part of the output
+        """
+        return self._get_spill(0, self._spill_size)
+
+    def _get_spill(self, start, stop):
+        """
+        Return the elided output between ``start`` and ``stop``
+
+        Only the part of the spill file that covers the range is
+        decoded.
+
+        INPUT:
+
+        - ``start``, ``stop`` -- integers. Character positions
+          relative to the start of the elided part.
+        """
+        stop = min(stop, self._spill_size)
+        if self._spill is None or start >= stop:
+            return ''
+        chars, offsets = self._spill_index_chars, self._spill_index_bytes
+        first = bisect_right(chars, start) - 1
+        last = bisect_right(chars, stop - 1)
+        byte_stop = offsets[last] if last < len(offsets) else self._spill_bytes
+        self._spill.flush()
+        data = mmap.mmap(self._spill.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            text = data[offsets[first]:byte_stop].decode('utf-8')
+        finally:
+            data.close()
+        base = chars[first]
+        return text[start - base:stop - base]
+
+    def head(self):
+        """
+        Return the part of the output before the elided part
+        """
+        if self._joined is None:
+            self._joined = ''.join(self._chunks)
+        return self._joined
+
+    @property
+    def tail_offset(self):
+        """
+        The position where the part after the elided part starts
+        """
+        return self._size + self._spill_size
+
+    def tail_region(self):
+        """
+        Return the part of the output after the elided part
+        """
+        return ''.join(text for stream, text in self._tail)
+
+    def getvalue(self):
+        """
+        Return the whole output as a single string
+
+        This includes the elided part.
+        """
+        return self.head() + self.load_elided() + self.tail_region()
+
+    __str__ = getvalue
+
+    def chunks(self, size=65536):
+        """
+        Iterate over the whole output in pieces
+
+        Use this instead of :meth:`getvalue` to write a huge output
+        somewhere without holding all of it in memory.
+
+        INPUT:
+
+        - ``size`` -- integer. The length of the pieces.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.output_buffer import OutputBuffer, OutputLimits
+            sage: buf = OutputBuffer(OutputLimits(max_bytes=10))
+            sage: buf.append('0123456789' * 3)
+            sage: buf.is_elided()
+            True
+            sage: list(buf.chunks(12))
+            ['012345678901', '234567890123', '456789']
+        """
+        for start in range(0, len(self), size):
+            yield self.get(start, start + size)
+
+    def get(self, start=0, stop=None):
+        """
+        Return the output between ``start`` and ``stop``
+
+        Only the chunks overlapping the requested range are joined.
+
+        INPUT:
+
+        - ``start``, ``stop`` -- integers. Like for slices, but must
+          not be negative.
+        """
+        size = len(self)
+        if stop is None or stop > size:
+            stop = size
+        if start >= stop:
+            return ''
+        head_size = self._size
+        result = []
+        if start < head_size:
+            result.append(self._get_head(start, min(stop, head_size)))
+        spill_end = head_size + self._spill_size
+        if start < spill_end and stop > head_size:
+            result.append(self._get_spill(max(start - head_size, 0), stop - head_size))
+        if stop > spill_end:
+            tail = self.tail_region()
+            result.append(tail[max(start - spill_end, 0):stop - spill_end])
+        return ''.join(result)
+
+    def _get_head(self, start, stop):
+        if self._joined is not None:
+            return self._joined[start:stop]
+        offsets = self._offsets
+        first = bisect_right(offsets, start) - 1
+        last = bisect_right(offsets, stop - 1)
+        text = ''.join(self._chunks[first:last])
+        base = offsets[first]
+        return text[start - base:stop - base]
+
+    def tail(self, n):
+        """
+        Return the last ``n`` characters
+        """
+        return self.get(max(0, len(self) - n))
+
+    def stream(self, stream=STDOUT):
+        """
+        Return the output of a single stream
+
+        The elided part of the output is not included.
+
+        INPUT:
+
+        - ``stream`` -- either ``STDOUT`` (default) or ``STDERR``.
+        """
+        head = [chunk for chunk, s in zip(self._chunks, self._streams) if s == stream]
+        tail = [text for s, text in self._tail if s == stream]
+        return ''.join(head + tail)
+
+    def stripped_size(self, start=0):
+        r"""
+        Return the size without trailing whitespace
+
+        INPUT:
+
+        - ``start`` -- integer. Do not look at the output before this
+          position.
+
+        OUTPUT:
+
+        The position after the last non-whitespace character, or
+        ``start`` if there is none after ``start``.
+
+        EXAMPLES:
+
+        If only whitespace follows the elided part, the trailing
+        whitespace of the elided part is not counted either::
+
+            sage: from sage_notebook.model.output_buffer import OutputBuffer, OutputLimits
+            sage: buf = OutputBuffer(OutputLimits(max_bytes=None, max_lines=4))
+            sage: buf.append('a\nb\nc  \n' + '\n' * 5)
+            sage: buf.is_elided(), buf.tail_region()
+            (True, '\n\n')
+            sage: buf.stripped_size(), len(buf.getvalue().rstrip())
+            (5, 5)
+        """
+        end = len(self)
+        for stream, text in reversed(self._tail):
+            stripped = len(text.rstrip())
+            end -= len(text) - stripped
+            if stripped > 0 or end <= start:
+                return max(start, end)
+        head_size = self._size
+        chars = self._spill_index_chars
+        for pos in range(len(chars) - 1, -1, -1):
+            text = self._get_spill(chars[pos], end - head_size)
+            end = head_size + chars[pos] + len(text.rstrip())
+            if end > head_size + chars[pos] or end <= start:
+                return max(start, end)
+        for pos in range(len(self._chunks) - 1, -1, -1):
+            chunk = self._chunks[pos]
+            stripped = len(chunk.rstrip())
+            end = self._offsets[pos] + stripped
+            if stripped > 0 or end <= start:
+                break
+        return max(start, end)
+
+    def close(self):
+        """
+        Delete the elided output on disk
+        """
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -2,20 +2,27 @@
 Model for the Worksheet
 """
 
+import os
+import uuid
 
+from .output_buffer import OutputBuffer, DEFAULT_LIMITS, STDOUT, STDERR
+from ..misc.order_statistic_tree import OrderStatisticTree
 
 
 class Cell(object):
 
-    def __init__(self, cell_id=None):
+    def __init__(self, cell_id=None, output_limits=DEFAULT_LIMITS):
         if cell_id is None:
-            import uuid
             self._id = uuid.uuid4().hex
         else:
             self._id = cell_id
         self._index = None
         self._input = ''
         self._busy = False
+        self._interrupted = False
+        self._output = None
+        self._output_limits = output_limits
+        self._output_version = 0
         self.clear_output()
 
     def __repr__(self):
@@ -39,19 +46,99 @@ class Cell(object):
     @index.setter
     def index(self, value):
         self._index = value
+        self._output_version += 1
+
+    @property
+    def output_version(self):
+        """
+        A counter that changes whenever the output or the evaluation
+        state of the cell changes
+
+        Views can use it to find out whether their rendering of the
+        cell output is still current.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.worksheet import Cell
+            sage: cell = Cell()
+            sage: version = cell.output_version
+            sage: cell.input = '1+1'
+            sage: cell.output_version == version
+            True
+            sage: cell.busy = True
+            sage: cell.accumulate_stdout('2')
+            sage: cell.output_version == version
+            False
+        """
+        return self._output_version
         
+    @property
+    def output_limits(self):
+        """
+        The :class:`~sage_notebook.model.output_buffer.OutputLimits`
+        for the output of the cell
+
+        Changing the limits only affects the current output if it is
+        still empty.
+        """
+        return self._output_limits
+
+    @output_limits.setter
+    def output_limits(self, value):
+        self._output_limits = value
+        if len(self._output) == 0:
+            self._output.close()
+            self._output = OutputBuffer(value)
+
     def clear_output(self):
         self._index = None
-        self._stdout = ''
-        self._stderr = ''
+        if self._output is not None:
+            self._output.close()
+        self._output = OutputBuffer(self._output_limits)
+        self._output_version += 1
         
     def accumulate_stdout(self, stdout):
         assert self._busy
-        self._stdout += stdout
+        self._output.append(stdout, STDOUT)
+        self._output_version += 1
 
     def accumulate_stderr(self, stderr):
         assert self._busy
-        self._stderr += stderr
+        self._output.append(stderr, STDERR)
+        self._output_version += 1
+
+    def restore_output(self, output, index=None):
+        """
+        Set the output of a cell that is not being evaluated
+
+        This is used when loading saved worksheets.
+
+        INPUT:
+
+        - ``output`` -- string. The output text.
+
+        - ``index`` -- integer or ``None``. The ``n`` in ``Out[n]``.
+        """
+        assert not self._busy
+        self.clear_output()
+        self._output.append(output)
+        self._index = index
+        self._output_version += 1
+
+    def append_restored_output(self, output):
+        """
+        Append to the output of a cell that is not being evaluated
+
+        This is used to restore a huge output in pieces after
+        :meth:`restore_output`.
+
+        INPUT:
+
+        - ``output`` -- string. The next piece of the output text.
+        """
+        assert not self._busy
+        self._output.append(output)
+        self._output_version += 1
 
     @property
     def busy(self):
@@ -63,9 +150,24 @@ class Cell(object):
     @busy.setter
     def busy(self, value):
         self._busy = value
+        self._output_version += 1
         if value is True:
+            self._interrupted = False
             self.clear_output()
 
+    @property
+    def interrupted(self):
+        """
+        Whether the last evaluation was interrupted (or cancelled)
+        before it finished
+        """
+        return self._interrupted
+
+    @interrupted.setter
+    def interrupted(self, value):
+        self._interrupted = value
+        self._output_version += 1
+
     @property
     def input(self):
         return self._input
@@ -76,31 +178,124 @@ class Cell(object):
 
     @property
     def stdout(self):
-        return self._stdout
+        return self._output.stream(STDOUT)
 
     @property
     def stderr(self):
-        return self._stderr
+        return self._output.stream(STDERR)
+
+    @property
+    def output(self):
+        """
+        The :class:`~sage_notebook.model.output_buffer.OutputBuffer`
+        holding stdout and stderr in the order in which they arrived.
+        """
+        return self._output
+
+    @property
+    def output_size(self):
+        """
+        The length of the output stream (stdout and stderr in the
+        order in which they arrived).
+        """
+        return len(self._output)
+
+    def output_delta(self, offset=0):
+        r"""
+        Return the output after ``offset``
+
+        Trailing whitespace is held back until more output follows,
+        so concatenating all deltas never leaves trailing whitespace.
+
+        INPUT:
+
+        - ``offset`` -- integer. The offset returned by the previous
+          call, or ``0`` to get the whole output.
+
+        OUTPUT:
+
+        A pair consisting of the new output and the offset to use
+        for the next call.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.worksheet import Cell
+            sage: cell = Cell()
+            sage: cell.busy = True
+            sage: cell.accumulate_stdout('1\n')
+            sage: cell.output_delta()
+            ('1', 1)
+            sage: cell.accumulate_stderr('2\n')
+            sage: cell.output_delta(1)
+            ('\n2', 3)
+        """
+        end = self._output.stripped_size(offset)
+        return (self._output.get(offset, end), end)
 
     def as_plain_text(self):
-        result = self._stdout.rstrip()
-        if len(self._stderr) > 0:
-            result += self._stderr.rstrip()
-        return result
+        r"""
+        Return the output as a string
+
+        EXAMPLES::
+
+            sage: from sage_notebook.model.worksheet import Cell
+            sage: cell = Cell()
+            sage: cell.busy = True
+            sage: cell.accumulate_stdout('1\n')
+            sage: cell.accumulate_stderr('2\n')
+            sage: cell.accumulate_stdout('3\n')
+            sage: cell.as_plain_text()
+            '1\n2\n3'
+        """
+        output = self._output
+        if output.is_elided():
+            return '{0}\n[{1} lines elided]\n{2}'.format(
+                output.head().rstrip(), output.elided_lines,
+                output.tail_region().rstrip())
+        return output.get(0, output.stripped_size())
 
 
 class Worksheet(object):
 
-    def __init__(self):
+    def __init__(self, loader=None, output_limits=DEFAULT_LIMITS):
+        """
+        The worksheet, an ordered collection of cells
+
+        INPUT:
+
+        - ``loader`` -- a
+          :class:`~sage_notebook.model.worksheet_file.WorksheetFile`
+          or ``None``. If specified, the cells are only materialized
+          from the file when they are first accessed.
+
+        - ``output_limits`` -- a
+          :class:`~sage_notebook.model.output_buffer.OutputLimits`. The
+          limits for the output of the cells in the worksheet. Cells
+          get them when they are inserted.
+
+        The attribute ``journal_seq`` is the sequence number of the
+        last journal entry that the worksheet already contains, see
+        :mod:`~sage_notebook.model.worksheet_journal`.
+        """
+        self._unsaved_id = 'unsaved-' + uuid.uuid4().hex
         self._cells_dict = dict()
-        self._order = list()
+        self._loader = loader
+        self.output_limits = output_limits
+        if loader is None:
+            self._order = OrderStatisticTree()
+            self.filename = None
+            self.journal_seq = 0
+        else:
+            self._order = OrderStatisticTree(loader.cell_ids())
+            self.filename = loader.filename
+            self.journal_seq = loader.journal_seq
 
     def __repr__(self):
         return 'Worksheet containing {0} cells'.format(self.n_cells())
 
     @classmethod
-    def create_default(cls):
-        ws = cls()
+    def create_default(cls, output_limits=DEFAULT_LIMITS):
+        ws = cls(output_limits=output_limits)
         c = Cell()
         c.input = '123'
         ws.append(c)
@@ -114,8 +309,65 @@ class Worksheet(object):
         c.input = 'for i in range(10):  # test\n    print i\n    sleep(0.4)\n'
         ws.append(c)
         return ws
-        
+
+    @property
+    def identity(self):
+        """
+        A string that identifies the worksheet
+
+        This is the absolute file name, or a unique id if the
+        worksheet was never saved. Two worksheets loaded from the same
+        file have the same identity.
+
+        EXAMPLES::
+
+            sage: import os
+            sage: from sage_notebook.model.worksheet import Worksheet
+            sage: ws = Worksheet()
+            sage: ws.identity.startswith('unsaved-')
+            True
+            sage: ws.identity == Worksheet().identity
+            False
+            sage: ws.filename = 'test.sagenb'
+            sage: ws.identity == os.path.abspath('test.sagenb')
+            True
+        """
+        if self.filename is None:
+            return self._unsaved_id
+        return os.path.abspath(self.filename)
+
+    @property
+    def loader(self):
+        """
+        The :class:`~sage_notebook.model.worksheet_file.WorksheetFile`
+        that cells are materialized from, or ``None``.
+        """
+        return self._loader
+
+    def save(self, filename=None):
+        """
+        Save the worksheet
+
+        INPUT:
+
+        - ``filename`` -- string or ``None`` (default). The file name
+          to save to. By default, the file that the worksheet was
+          loaded from or last saved to.
+        """
+        from .worksheet_file import WorksheetFile
+        if filename is None:
+            filename = self.filename
+        if filename is None:
+            raise ValueError('worksheet has no file name')
+        loader = WorksheetFile.write(self, filename)
+        if self._loader is not None:
+            self._loader.close()
+        self._loader = loader
+        self.filename = filename
+
+
     def insert(self, pos, cell):
+        cell.output_limits = self.output_limits
         self._cells_dict[cell.id] = cell
         self._order.insert(pos, cell.id)
 
@@ -126,23 +378,63 @@ class Worksheet(object):
         return self._order.index(cell.id)
 
     def delete(self, cell):
-        del self._cells_dict[cell.id]
-        self._order.remove(cell.id)
+        self.remove(cell.id)
         if self.n_cells() == 0:
             self.append(Cell())
 
+    def remove(self, cell_id):
+        """
+        Remove the cell with id ``cell_id``
+
+        Unlike :meth:`delete`, this can leave the worksheet empty and
+        does not require the cell to be materialized.
+        """
+        self._order.remove(cell_id)
+        self._cells_dict.pop(cell_id, None)
+
+    def move(self, cell_id, pos):
+        """
+        Move the cell with id ``cell_id`` to position ``pos``
+        """
+        self._order.remove(cell_id)
+        self._order.insert(pos, cell_id)
+
+    def has_cell_id(self, cell_id):
+        return cell_id in self._order
+
     def n_cells(self):
-        return len(self._cells_dict)
+        return len(self._order)
 
     __len__ = n_cells
 
     def get_cell(self, cell_id):
-        return self._cells_dict[cell_id]
+        try:
+            return self._cells_dict[cell_id]
+        except KeyError:
+            if cell_id not in self._order:
+                raise
+        cell = self._cells_dict[cell_id] = self._loader.load_cell(cell_id, self.output_limits)
+        return cell
+
+    def get_loaded_cell(self, cell_id):
+        """
+        Return the cell if it is already materialized, or ``None``
+        """
+        return self._cells_dict.get(cell_id, None)
+
+    def cell_ids(self):
+        """
+        Iterate over the cell ids without materializing the cells
+        """
+        return iter(self._order)
+
+    def __contains__(self, cell):
+        return self._cells_dict.get(cell.id, None) is cell
 
     def __getitem__(self, i):
         cell_id = self._order[i]
-        return self._cells_dict[cell_id]
+        return self.get_cell(cell_id)
 
     def __iter__(self):
         for cell_id in self._order:
-            yield self._cells_dict[cell_id]
+            yield self.get_cell(cell_id)
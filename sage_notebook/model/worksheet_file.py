@@ -0,0 +1,330 @@
+r"""
+Indexed Worksheet Files
+
+Worksheets are stored in a binary file that can be opened without
+parsing all cells. The file consists of
+
+* a header with magic bytes, the format version, the number of
+  cells, and the sequence number of the last journal entry that the
+  file contains (see :mod:`~sage_notebook.model.worksheet_journal`),
+
+* the index: for each cell, in worksheet order, the cell id together
+  with the offset and length of its record,
+
+* the cell records: the ``Out[n]`` index followed by the
+  length-prefixed input and output (utf-8 encoded).
+
+All integers are big-endian. Opening a worksheet only reads the header
+and the index from a memory map of the file. The
+:class:`~sage_notebook.model.worksheet.Cell` objects are only created
+when the cell is accessed.
+
+EXAMPLES::
+
+    sage: import os, tempfile
+    sage: from sage_notebook.model.worksheet import Worksheet, Cell
+    sage: from sage_notebook.model.worksheet_file import WorksheetFile
+    sage: ws = Worksheet()
+    sage: for i in range(3):
+    ....:     cell = Cell()
+    ....:     cell.input = 'print {0}'.format(i)
+    ....:     cell.restore_output(str(i), i + 1)
+    ....:     ws.append(cell)
+    sage: filename = os.path.join(tempfile.mkdtemp(), 'test.sagenb')
+    sage: ws.save(filename)
+    sage: ws.loader
+    Worksheet file with 3 cells
+
+    sage: ws2 = Worksheet(WorksheetFile(filename))
+    sage: len(ws2)
+    3
+    sage: cell_id = list(ws2.cell_ids())[1]
+    sage: ws2.get_loaded_cell(cell_id) is None
+    True
+    sage: cell = ws2[1]
+    sage: cell.input, cell.index, cell.as_plain_text()
+    ('print 1', 2, '1')
+    sage: ws2.get_loaded_cell(cell_id) is cell
+    True
+
+Cells that were never accessed are copied verbatim when saving::
+
+    sage: cell.input = 'print 42'
+    sage: ws2.save()
+    sage: ws3 = Worksheet(WorksheetFile(filename))
+    sage: [c.input for c in ws3]
+    ['print 0', 'print 42', 'print 2']
+    sage: ws.loader.close();  ws2.loader.close();  ws3.loader.close()
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import os
+import io
+import codecs
+import mmap
+import stat
+import struct
+import tempfile
+
+from .worksheet import Cell
+from .output_buffer import DEFAULT_LIMITS
+
+
+EXTENSION = '.sagenb'
+
+MAGIC = b'SAGENB\r\n'
+VERSION = 2
+
+HEADER = struct.Struct('>8sIIQ')         # magic, version, number of cells, journal seq
+INDEX_ENTRY = struct.Struct('>32sQI')    # cell id, record offset, record length
+RECORD_INDEX = struct.Struct('>i')       # Out[n], or -1 for None
+LENGTH = struct.Struct('>I')
+
+# Records are copied and outputs decoded in pieces of this many bytes
+CHUNK_SIZE = 1 << 16
+
+
+def _encode_cell_id(cell_id):
+    data = cell_id.encode('ascii')
+    if len(data) > 32:
+        raise ValueError('cell id is too long: {0}'.format(cell_id))
+    return data
+
+
+def _file_mode(filename):
+    """
+    Return the permissions for writing ``filename``
+
+    An existing file keeps its permissions, a new file gets the
+    default permissions (respecting the umask).
+    """
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _write_record(f, cell):
+    """
+    Write the record for ``cell`` to the file ``f``
+
+    The output is written in pieces, so a huge output that was moved
+    to disk is never held in memory.
+
+    OUTPUT:
+
+    The length of the record.
+    """
+    start = f.tell()
+    index = -1 if cell.index is None else cell.index
+    input_data = cell.input.encode('utf-8')
+    f.write(RECORD_INDEX.pack(index))
+    f.write(LENGTH.pack(len(input_data)))
+    f.write(input_data)
+    length_pos = f.tell()
+    f.write(LENGTH.pack(0))
+    output_length = 0
+    for chunk in cell.output.chunks(CHUNK_SIZE):
+        data = chunk.encode('utf-8')
+        f.write(data)
+        output_length += len(data)
+    end = f.tell()
+    f.seek(length_pos)
+    f.write(LENGTH.pack(output_length))
+    f.seek(end)
+    return end - start
+
+
+class WorksheetFile(object):
+
+    def __init__(self, filename):
+        """
+        Read access to a worksheet file
+
+        Only the header and index are parsed. The cell records are
+        read from a memory map on demand.
+
+        INPUT:
+
+        - ``filename`` -- string. The name of an existing worksheet
+          file.
+        """
+        self._filename = filename
+        with io.open(filename, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_index()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def _read_index(self):
+        data = self._data
+        magic, version, n_cells, self._journal_seq = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('not a worksheet file: {0}'.format(self._filename))
+        if version != VERSION:
+            raise ValueError('unsupported worksheet file version {0}'.format(version))
+        pos = HEADER.size
+        self._order = order = []
+        self._records = records = dict()
+        for i in range(n_cells):
+            cell_id, offset, length = INDEX_ENTRY.unpack_from(data, pos)
+            cell_id = cell_id.rstrip(b'\0').decode('ascii')
+            if offset + length > len(data):
+                raise ValueError('truncated worksheet file: {0}'.format(self._filename))
+            order.append(cell_id)
+            records[cell_id] = (offset, length)
+            pos += INDEX_ENTRY.size
+
+    def __repr__(self):
+        return 'Worksheet file with {0} cells'.format(len(self))
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __len__(self):
+        return len(self._order)
+
+    @property
+    def journal_seq(self):
+        """
+        The sequence number of the last journal entry in the file
+        """
+        return self._journal_seq
+
+    def __contains__(self, cell_id):
+        return cell_id in self._records
+
+    def cell_ids(self):
+        """
+        Return the cell ids in worksheet order
+        """
+        return iter(self._order)
+
+    def copy_record(self, cell_id, f):
+        """
+        Write the undecoded record of the cell to the file ``f``
+
+        OUTPUT:
+
+        The length of the record.
+        """
+        offset, length = self._records[cell_id]
+        data = self._data
+        for start in range(offset, offset + length, CHUNK_SIZE):
+            f.write(data[start:min(start + CHUNK_SIZE, offset + length)])
+        return length
+
+    def load_cell(self, cell_id, output_limits=DEFAULT_LIMITS):
+        """
+        Construct the cell from its record
+
+        INPUT:
+
+        - ``cell_id`` -- string. The id of a cell in the file.
+
+        - ``output_limits`` -- a
+          :class:`~sage_notebook.model.output_buffer.OutputLimits`. The
+          limits for the restored output.
+
+        OUTPUT:
+
+        A new :class:`~sage_notebook.model.worksheet.Cell`.
+        """
+        data = self._data
+        pos = self._records[cell_id][0]
+        index, = RECORD_INDEX.unpack_from(data, pos)
+        pos += RECORD_INDEX.size
+        length, = LENGTH.unpack_from(data, pos)
+        pos += LENGTH.size
+        input_string = data[pos:pos + length].decode('utf-8')
+        pos += length
+        length, = LENGTH.unpack_from(data, pos)
+        pos += LENGTH.size
+        cell = Cell(cell_id, output_limits)
+        cell.input = input_string
+        cell.restore_output('', None if index < 0 else index)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        end = pos + length
+        for start in range(pos, end, CHUNK_SIZE):
+            stop = min(start + CHUNK_SIZE, end)
+            cell.append_restored_output(decoder.decode(data[start:stop], stop == end))
+        return cell
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    @classmethod
+    def write(cls, worksheet, filename):
+        """
+        Save the worksheet
+
+        The file is written atomically, that is, to a temporary file
+        which is then renamed. Cells that were never materialized are
+        copied from the worksheet's current file without decoding
+        them. Outputs are written in pieces, so saving never holds a
+        whole output in memory.
+
+        INPUT:
+
+        - ``worksheet`` -- a
+          :class:`~sage_notebook.model.worksheet.Worksheet`.
+
+        - ``filename`` -- string. The file name to save to.
+
+        OUTPUT:
+
+        A new :class:`WorksheetFile` for the saved file.
+        """
+        loader = worksheet.loader
+        cell_ids = list(worksheet.cell_ids())
+        index = []
+        offset = HEADER.size + INDEX_ENTRY.size * len(cell_ids)
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.worksheet-', dir=directory)
+        try:
+            with io.open(fd, 'wb') as f:
+                # the records are streamed first, the index is filled in afterwards
+                f.seek(offset)
+                for cell_id in cell_ids:
+                    cell = worksheet.get_loaded_cell(cell_id)
+                    if cell is None:
+                        length = loader.copy_record(cell_id, f)
+                    else:
+                        length = _write_record(f, cell)
+                    index.append(INDEX_ENTRY.pack(_encode_cell_id(cell_id), offset, length))
+                    offset += length
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, len(cell_ids), worksheet.journal_seq))
+                f.writelines(index)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_filename, _file_mode(filename))
+            getattr(os, 'replace', os.rename)(tmp_filename, filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+        return cls(filename)
@@ -0,0 +1,482 @@
+r"""
+Write-Ahead Journal for Worksheets
+
+Rewriting the whole worksheet file after every change would be far too
+slow for big worksheets. Instead, changes are appended to a journal
+file next to the worksheet file, one JSON object per line. The journal
+is written and fsynced in batches, and merged into the worksheet file
+in a background thread once it grows too large.
+
+When a worksheet is opened, the journal is replayed on top of the
+worksheet file. Each entry has a sequence number, and the worksheet
+file records the sequence number of the last entry that was merged
+into it. Replaying skips the entries that the file already contains.
+Since the worksheet file is replaced atomically, it does not matter
+whether a crash happened before or after the merged journal was
+deleted.
+
+EXAMPLES::
+
+    sage: import os, tempfile
+    sage: from sage_notebook.model.worksheet import Worksheet, Cell
+    sage: from sage_notebook.model.worksheet_file import WorksheetFile
+    sage: from sage_notebook.model.worksheet_journal import Journal
+    sage: filename = os.path.join(tempfile.mkdtemp(), 'test.sagenb')
+    sage: ws = Worksheet()
+    sage: ws.append(Cell('a'))
+    sage: ws.save(filename)
+
+    sage: timers = []
+    sage: def call_later(seconds, callback):
+    ....:     timers.append(callback)
+    sage: journal = Journal(filename, call_later)
+    sage: journal.insert(1, Cell('b'))
+    sage: journal.input(ws.get_cell('a'), '1+1')
+    sage: cell = ws.get_cell('a')
+    sage: cell.restore_output('2', 1)
+    sage: journal.output(cell)
+    sage: journal.delete('a')
+    sage: len(timers)
+    1
+    sage: timers.pop()()
+    sage: journal.close()
+
+Recover from the worksheet file and the journal::
+
+    sage: ws = Worksheet(WorksheetFile(filename))
+    sage: Journal.replay(ws)
+    4
+    sage: list(ws.cell_ids())
+    ['b']
+
+Merge the journal into the worksheet file::
+
+    sage: journal = Journal(filename, call_later)
+    sage: journal.compact()
+    sage: journal.close()
+    sage: os.path.exists(journal.filename)
+    False
+    sage: ws = Worksheet(WorksheetFile(filename))
+    sage: Journal.replay(ws)
+    0
+    sage: list(ws.cell_ids())
+    ['b']
+    sage: ws.journal_seq
+    4
+
+Moves are not idempotent, but a journal that is left over after it was
+merged is skipped::
+
+    sage: import shutil
+    sage: for cell_id in 'ac':
+    ....:     ws.append(Cell(cell_id))
+    sage: ws.save()
+    sage: journal = Journal(filename, call_later, seq=ws.journal_seq)
+    sage: journal.move('b', 1)
+    sage: journal.move('a', 2)
+    sage: journal.flush()
+    sage: _ = shutil.copy(journal.filename, filename + '.journal.copy')
+    sage: journal.compact()
+    sage: journal.close()
+    sage: os.rename(filename + '.journal.copy', filename + '.journal.compacting')
+    sage: ws = Worksheet(WorksheetFile(filename))
+    sage: Journal.replay(ws)
+    0
+    sage: list(ws.cell_ids())
+    ['b', 'c', 'a']
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import os
+import io
+import sys
+import json
+import threading
+import logging
+logger = logging.getLogger('GUI')
+
+from .worksheet import Cell, Worksheet
+from .worksheet_file import WorksheetFile
+
+
+JOURNAL_SUFFIX = '.journal'
+COMPACTING_SUFFIX = '.journal.compacting'
+
+# Outputs are journaled in entries of at most this many characters
+OUTPUT_CHUNK_SIZE = 1 << 16
+
+# Pending entries are written (but not fsynced) once they exceed this size
+MAX_PENDING_SIZE = 1 << 20
+
+
+def apply_entry(worksheet, entry):
+    """
+    Apply a single journal entry to the worksheet
+
+    Entries that were already applied, or that refer to cells that do
+    not exist, are ignored.
+
+    INPUT:
+
+    - ``worksheet`` -- a
+      :class:`~sage_notebook.model.worksheet.Worksheet`.
+
+    - ``entry`` -- dictionary. A decoded line of the journal.
+    """
+    op = entry['op']
+    cell_id = entry['id']
+    exists = worksheet.has_cell_id(cell_id)
+    if op == 'insert':
+        if not exists:
+            cell = Cell(cell_id)
+            cell.input = entry['input']
+            pos = min(entry['pos'], worksheet.n_cells())
+            worksheet.insert(pos, cell)
+    elif not exists:
+        return
+    elif op == 'delete':
+        worksheet.remove(cell_id)
+    elif op == 'move':
+        worksheet.move(cell_id, entry['pos'])
+    elif op == 'input':
+        worksheet.get_cell(cell_id).input = entry['input']
+    elif op == 'output':
+        cell = worksheet.get_cell(cell_id)
+        if not cell.busy:
+            cell.restore_output(entry['output'], entry['index'])
+    elif op == 'output-append':
+        cell = worksheet.get_cell(cell_id)
+        if not cell.busy:
+            cell.append_restored_output(entry['output'])
+    else:
+        raise ValueError('unknown journal operation: {0}'.format(op))
+
+
+class Journal(object):
+
+    def __init__(self, worksheet_filename, call_later, interval=2, compact_bytes=1000000,
+                 seq=0):
+        """
+        Append-only log of changes to a saved worksheet
+
+        INPUT:
+
+        - ``worksheet_filename`` -- string. The worksheet file. The
+          journal is stored next to it.
+
+        - ``call_later`` -- callable. ``call_later(seconds, callback)``
+          must arrange for ``callback()`` to be called after the given
+          number of seconds, see
+          :meth:`~sage_notebook.main_loop.MainLoopABC.call_later`.
+
+        - ``interval`` -- number. The time in seconds between writing
+          the pending entries to disk.
+
+        - ``compact_bytes`` -- integer. Merge the journal into the
+          worksheet file in the background when it is larger than
+          this many bytes.
+
+        - ``seq`` -- integer. The sequence number of the last entry,
+          usually the ``journal_seq`` of the worksheet. New entries
+          are numbered after it.
+        """
+        self._worksheet_filename = worksheet_filename
+        self._seq = seq
+        self._call_later = call_later
+        self._interval = interval
+        self._compact_bytes = compact_bytes
+        self._pending = []
+        self._pending_size = 0
+        self._scheduled = False
+        self._file = None
+        self._unsynced = False
+        try:
+            self._size = os.path.getsize(self.filename)
+        except OSError:
+            self._size = 0
+        self._compaction = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Journal for {0}'.format(self._worksheet_filename)
+
+    @property
+    def filename(self):
+        return self._worksheet_filename + JOURNAL_SUFFIX
+
+    @property
+    def seq(self):
+        """
+        The sequence number of the last entry
+        """
+        return self._seq
+
+    @classmethod
+    def _read(cls, filename):
+        """
+        Iterate over the entries in the journal ``filename``
+
+        An incomplete last line, which is what a crash while writing
+        leaves behind, is ignored.
+        """
+        try:
+            f = io.open(filename, 'r', encoding='utf-8')
+        except (IOError, OSError):
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning('ignoring corrupt journal entry in %s', filename)
+
+    @classmethod
+    def replay(cls, worksheet):
+        """
+        Apply the journal to the worksheet that was just loaded
+
+        INPUT:
+
+        - ``worksheet`` -- a
+          :class:`~sage_notebook.model.worksheet.Worksheet` loaded
+          from a file.
+
+        OUTPUT:
+
+        The number of journal entries that were applied. Entries that
+        the worksheet file already contains are skipped.
+        """
+        count = 0
+        for suffix in (COMPACTING_SUFFIX, JOURNAL_SUFFIX):
+            count += cls._apply(worksheet, cls._read(worksheet.filename + suffix))
+        return count
+
+    @classmethod
+    def _apply(cls, worksheet, entries):
+        """
+        Apply the entries that are newer than the worksheet
+        """
+        count = 0
+        for entry in entries:
+            seq = entry.get('seq', 0)
+            if seq <= worksheet.journal_seq:
+                continue
+            apply_entry(worksheet, entry)
+            worksheet.journal_seq = seq
+            count += 1
+        return count
+
+    def _append(self, entry):
+        self._seq += 1
+        entry['seq'] = self._seq
+        line = json.dumps(entry) + '\n'
+        if sys.version_info.major < 3:
+            line = line.decode('utf-8')
+        self._pending.append(line)
+        self._pending_size += len(line)
+        if self._pending_size > MAX_PENDING_SIZE:
+            self._write_pending()
+        if not self._scheduled:
+            self._scheduled = True
+            self._call_later(self._interval, self._on_timer)
+
+    def insert(self, pos, cell):
+        self._append(dict(op='insert', id=cell.id, pos=pos, input=cell.input))
+
+    def delete(self, cell_id):
+        self._append(dict(op='delete', id=cell_id))
+
+    def move(self, cell_id, pos):
+        self._append(dict(op='move', id=cell_id, pos=pos))
+
+    def input(self, cell, input_string):
+        self._append(dict(op='input', id=cell.id, input=input_string))
+
+    def output(self, cell):
+        """
+        Journal the output of a finished cell
+
+        A long output is split into several entries, so it is never
+        held in memory as a whole.
+
+        EXAMPLES::
+
+            sage: import os, tempfile
+            sage: from sage_notebook.model import worksheet_journal
+            sage: from sage_notebook.model.worksheet import Worksheet, Cell
+            sage: from sage_notebook.model.worksheet_file import WorksheetFile
+            sage: filename = os.path.join(tempfile.mkdtemp(), 'test.sagenb')
+            sage: ws = Worksheet()
+            sage: ws.append(Cell('a'))
+            sage: ws.save(filename)
+            sage: journal = worksheet_journal.Journal(filename, lambda seconds, callback: None)
+            sage: cell = ws.get_cell('a')
+            sage: cell.restore_output('0123456789', 1)
+            sage: worksheet_journal.OUTPUT_CHUNK_SIZE = 4
+            sage: journal.output(cell)
+            sage: worksheet_journal.OUTPUT_CHUNK_SIZE = 1 << 16
+            sage: journal.close()
+            sage: [entry['op'] for entry in journal._read(journal.filename)]
+            ['output', 'output-append', 'output-append']
+            sage: ws = Worksheet(WorksheetFile(filename))
+            sage: worksheet_journal.Journal.replay(ws)
+            3
+            sage: ws.get_cell('a').as_plain_text()
+            '0123456789'
+        """
+        pieces = cell.output.chunks(OUTPUT_CHUNK_SIZE)
+        self._append(dict(op='output', id=cell.id, index=cell.index,
+                          output=next(pieces, '')))
+        for piece in pieces:
+            self._append(dict(op='output-append', id=cell.id, output=piece))
+
+    def _on_timer(self):
+        self._scheduled = False
+        self.flush()
+        if self._size > self._compact_bytes and self._compaction is None:
+            self.compact(background=True)
+        self._join_compaction(block=False)
+
+    def _write_pending(self):
+        """
+        Write the pending entries without waiting for the disk
+        """
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        with self._lock:
+            if self._file is None:
+                self._file = io.open(self.filename, 'a', encoding='utf-8')
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self._unsynced = True
+
+    def flush(self):
+        """
+        Write and fsync the pending entries
+        """
+        self._write_pending()
+        with self._lock:
+            if self._unsynced:
+                os.fsync(self._file.fileno())
+                self._unsynced = False
+
+    def compact(self, background=False):
+        """
+        Merge the journal into the worksheet file
+
+        The journal is renamed and a new journal is started, so that
+        new entries can be written while the worksheet file is being
+        rewritten.
+
+        INPUT:
+
+        - ``background`` -- boolean. Whether to rewrite the worksheet
+          file in a separate thread.
+        """
+        self._join_compaction()
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._size = 0
+            if not os.path.exists(self.filename):
+                return
+            os.rename(self.filename, self._worksheet_filename + COMPACTING_SUFFIX)
+        if background:
+            self._compaction = threading.Thread(
+                target=self._compact_worker, name='journal compaction')
+            self._compaction.start()
+        else:
+            self._compact_worker()
+
+    def _compact_worker(self):
+        """
+        Rewrite the worksheet file with the renamed journal applied
+
+        This only touches files, never the worksheet in memory, so it
+        is safe to run in a separate thread.
+        """
+        compacting = self._worksheet_filename + COMPACTING_SUFFIX
+        try:
+            worksheet = Worksheet(WorksheetFile(self._worksheet_filename))
+            self._apply(worksheet, self._read(compacting))
+            # commits the merge, even if removing the journal fails
+            worksheet.save()
+            worksheet.loader.close()
+            os.remove(compacting)
+        except (IOError, OSError, ValueError):
+            logger.exception('merging %s failed', compacting)
+
+    def _join_compaction(self, block=True):
+        thread = self._compaction
+        if thread is None:
+            return
+        if not block and thread.is_alive():
+            return
+        thread.join()
+        self._compaction = None
+
+    def discard(self):
+        """
+        Delete the journal
+
+        Call this after saving the whole worksheet.
+        """
+        self._join_compaction()
+        self._pending = []
+        self._pending_size = 0
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._unsynced = False
+            self._size = 0
+            self.remove_files(self._worksheet_filename)
+
+    @classmethod
+    def remove_files(cls, worksheet_filename):
+        """
+        Delete the journal files of a worksheet file, if any
+
+        INPUT:
+
+        - ``worksheet_filename`` -- string. The worksheet file.
+        """
+        for suffix in (JOURNAL_SUFFIX, COMPACTING_SUFFIX):
+            try:
+                os.remove(worksheet_filename + suffix)
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Write the pending entries and wait for the compaction to finish
+        """
+        self.flush()
+        self._join_compaction()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
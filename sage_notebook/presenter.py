@@ -27,6 +27,8 @@ about data nor about the gui, it just ties the two together.
 import logging
 logger = logging.getLogger('GUI')
 
+from .misc.update_batcher import UpdateBatcher
+
 
 class Presenter(object):
 
@@ -35,7 +37,10 @@ class Presenter(object):
         self.view = view_class(self)
         self.model = model_class(self)
         self.main_loop.add_view(self.view)
-        self.main_loop.add_rpc_clients(self.model.get_rpc_clients())
+        c = self.model.config
+        self._output_batcher = UpdateBatcher(
+            self._flush_cell_update, self.main_loop.call_later,
+            1.0 / c.output_update_rate, c.output_update_bytes)
         if self.model.config.sage_root is None:
             callback = self.on_setup_assistant_first_run_finished
             self.show_setup_assistant(None, None, callback)
@@ -62,15 +67,52 @@ class Presenter(object):
     ###################################################################
     # The main Notebook window
 
-    def evaluate_cell_init(self, cell_id, input_string):
+    def evaluate_cell_init(self, cell_id, input_string, priority=None):
         """
         Initiate evaluating a notebook cell
+
+        INPUT:
+
+        - ``priority`` -- integer or ``None`` (default: run before
+          any batch evaluation). Cells with smaller priority are
+          evaluated first, see :mod:`~sage_notebook.model.compute_queue`.
         """
         logger.info('evaluating cell %s', cell_id)
-        cell = self.model.eval_cell_init(cell_id, input_string)
+        if priority is None:
+            cell = self.model.eval_cell_init(cell_id, input_string)
+        else:
+            cell = self.model.eval_cell_init(cell_id, input_string, priority)
         self.view.notebook_window.cell_busy(cell)
 
-    def on_evaluate_cell_updated(self, cell_id, cell):
+    def evaluate_all_init(self):
+        """
+        Initiate evaluating all cells of the worksheet in order
+        """
+        for cell in self.model.eval_all_init():
+            self.view.notebook_window.cell_busy(cell)
+
+    def evaluate_interrupt(self):
+        """
+        Interrupt the running computation and drop the waiting cells
+
+        Each affected cell gets the usual
+        :meth:`on_evaluate_cell_finished` callback, with
+        :attr:`~sage_notebook.model.worksheet.Cell.interrupted` set.
+        """
+        logger.info('interrupting computation')
+        self.model.eval_interrupt()
+
+    def evaluate_cell_cancel(self, cell_id):
+        """
+        Stop waiting to evaluate a cell
+
+        The usual :meth:`on_evaluate_cell_finished` callback follows
+        if the cell was still waiting for evaluation.
+        """
+        logger.info('cancel evaluating cell %s', cell_id)
+        self.model.eval_cell_cancel(cell_id)
+
+    def on_evaluate_cell_updated(self, cell_id, cell, nbytes=0):
         """
         Callback for changes in a notebook cell that is currently
         computing.
@@ -78,10 +120,22 @@ class Presenter(object):
         Typically, this adds partial output. This may only be
         triggered after a preceeding :meth:`evaluate_cell_init`, and
         not after a subsequent :meth:`on_evaluate_cell_finish`.
+
+        Updates of the view are coalesced and happen at most
+        :meth:`~sage_notebook.model.config.Config.output_update_rate`
+        times per second.
+
+        INPUT:
+
+        - ``nbytes`` -- integer. The size of the new output.
         """
         logger.debug('updating cell %s', cell_id)
         self.model.eval_cell_update(cell)
-        self.view.notebook_window.cell_update(cell)
+        self._output_batcher.update(cell_id, cell, nbytes)
+
+    def _flush_cell_update(self, cell):
+        if self.model.is_current_cell(cell):
+            self.view.notebook_window.cell_update(cell)
 
     def on_evaluate_cell_finished(self, cell_id, cell):
         """
@@ -97,18 +151,82 @@ class Presenter(object):
         """
         logger.info('finished cell %s', cell_id)
         self.model.eval_cell_finished(cell)
-        self.view.notebook_window.cell_finished(cell)
+        self._output_batcher.discard(cell_id)
+        if self.model.is_current_cell(cell):
+            self.view.notebook_window.cell_finished(cell)
+
+    def on_compute_client_started(self, rpc_client):
+        """
+        Callback when the model connected a new compute client.
+
+        Every compute session has its own client. Their sockets
+        are all watched by the main loop.
+        """
+        self.main_loop.add_rpc_clients([rpc_client])
+
+    def on_compute_client_changed(self, rpc_client):
+        """
+        Callback when the model sent a request to the compute client.
+        """
+        self.main_loop.rpc_client_changed(rpc_client)
+
+    def on_compute_client_stopped(self, rpc_client):
+        """
+        Callback when the model is about to close a compute client.
+        """
+        self.main_loop.remove_rpc_clients([rpc_client])
+
+    def load_elided_output(self, cell_id):
+        """
+        Return the elided part of a huge cell output.
+
+        Output beyond the limits in the configuration is not
+        displayed, only its head and tail. The view calls this method
+        when the user asks to see everything.
+        """
+        return self.model.load_elided_output(cell_id)
+
+    def set_cell_input(self, cell_id, input_string):
+        """
+        Save the input of a cell that was edited but not evaluated.
+
+        The view calls this before it stops displaying the cell.
+        """
+        self.model.set_cell_input(cell_id, input_string)
 
     def insert_cell_at(self, pos, template_cell=None):
         cell = self.model.insert_cell_at(pos, template_cell)
-        self.view.notebook_window.set_worksheet(self.model.worksheet)
         self.view.notebook_window.cell_grab_focus(cell)
 
     def delete_cell(self, cell_id):
         cell = self.model.delete_cell(cell_id)
-        self.view.notebook_window.set_worksheet(self.model.worksheet)
         self.view.notebook_window.cell_grab_focus(cell)
 
+    def move_cell(self, cell_id, pos):
+        self.model.move_cell(cell_id, pos)
+
+    def on_cell_inserted(self, pos, cell):
+        """
+        Callback when the model inserted ``cell`` at position ``pos``
+        of the current worksheet.
+        """
+        self.view.notebook_window.cell_inserted(pos, cell)
+
+    def on_cell_deleted(self, pos, cell):
+        """
+        Callback when the model deleted ``cell`` at position ``pos``
+        of the current worksheet.
+        """
+        self._output_batcher.discard(cell.id)
+        self.view.notebook_window.cell_deleted(pos, cell)
+
+    def on_cell_moved(self, old_pos, new_pos, cell):
+        """
+        Callback when the model moved ``cell`` within the current
+        worksheet.
+        """
+        self.view.notebook_window.cell_moved(old_pos, new_pos, cell)
+
     def code_complete_init(self, input_string, cursor_pos, cell_id, label=None):
         """
         Initiate auto-completion.
@@ -145,7 +263,10 @@ class Presenter(object):
           instance. The code completion for the request initiated with
           :meth:`code_complete_init`.
         """
-        cell = self.model.get_cell(completion.request.cell_id)
+        try:
+            cell = self.model.get_cell(completion.request.cell_id)
+        except KeyError:
+            return   # worksheet was closed in the meantime
         self.model.code_complete_finished(cell, completion)
         self.view.notebook_window.code_complete_finished(cell, completion)
 
@@ -153,11 +274,74 @@ class Presenter(object):
         """
         Load & display a new worksheet.
         """
-        # TODO: load different worksheets
         model = self.model.load_worksheet()
         view = self.show_notebook_window()
         view.set_worksheet(model)
 
+    def get_notebooks_directory(self):
+        return self.model.config.notebooks_directory
+
+    def get_worksheet_extension(self):
+        return self.model.get_worksheet_extension()
+
+    def get_worksheet_filename(self):
+        """
+        Return the file name of the current worksheet, or ``None`` if
+        it was never saved.
+        """
+        return self.model.worksheet.filename
+
+    def new_worksheet(self):
+        """
+        Replace the displayed worksheet with a new one
+        """
+        ws = self.model.new_worksheet()
+        self.view.notebook_window.set_worksheet(ws)
+
+    def open_worksheet(self, filename):
+        """
+        Load & display the worksheet saved in ``filename``
+        """
+        logger.info('opening worksheet %s', filename)
+        try:
+            ws = self.model.load_worksheet(filename)
+        except (IOError, OSError, ValueError) as e:
+            self.show_error(self.view.notebook_window, 'Cannot open worksheet', str(e))
+            return
+        self.view.notebook_window.set_worksheet(ws)
+
+    def save_worksheet(self, filename=None):
+        """
+        Save the current worksheet
+
+        INPUT:
+
+        - ``filename`` -- string or ``None`` (default). The file name
+          to save to. By default, the file that the worksheet was
+          loaded from or last saved to.
+
+        OUTPUT:
+
+        Boolean. Whether the worksheet was saved. This is ``False`` if
+        the worksheet has no file name yet, in which case the view
+        should ask for one.
+        """
+        if filename is None:
+            filename = self.get_worksheet_filename()
+            if filename is None:
+                return False
+        else:
+            extension = self.get_worksheet_extension()
+            if not filename.endswith(extension):
+                filename += extension
+        logger.info('saving worksheet %s', filename)
+        try:
+            self.model.save_worksheet(filename)
+        except (IOError, OSError, ValueError) as e:
+            self.show_error(self.view.notebook_window, 'Cannot save worksheet', str(e))
+            return False
+        return True
+
     def show_notebook_window(self):
         return self.view.show_notebook_window()
 
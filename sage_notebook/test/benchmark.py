@@ -0,0 +1,138 @@
+"""
+Benchmarks for the Worksheet Data Model
+
+Run with::
+
+    python -m sage_notebook.test.benchmark [n_cells]
+    python -m sage_notebook.test.benchmark widgets [n_widgets]
+
+The first times structural edits of a worksheet with many cells,
+which should take logarithmic time in the number of cells. The second
+measures the time and memory to construct GTK cell widgets, and
+requires a display.
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+from __future__ import print_function
+
+import sys
+import time
+import random
+
+from sage_notebook.model.worksheet import Worksheet, Cell
+
+
+def timed(name, n_ops, func):
+    """
+    Run ``func()`` and print the time per operation
+    """
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print('{0:>12}: {1:8.2f} us/op ({2} ops)'.format(
+        name, 1e6 * elapsed / n_ops, n_ops))
+
+
+def benchmark_worksheet(n_cells=100000, n_ops=10000, seed=0):
+    """
+    Time appending, inserting, finding, accessing and deleting cells
+    """
+    rng = random.Random(seed)
+    ws = Worksheet()
+    cells = [Cell() for i in range(n_cells)]
+    print('worksheet with {0} cells'.format(n_cells))
+
+    def append():
+        for cell in cells:
+            ws.append(cell)
+    timed('append', n_cells, append)
+
+    new_cells = [Cell() for i in range(n_ops)]
+    def insert():
+        for cell in new_cells:
+            ws.insert(rng.randint(0, ws.n_cells()), cell)
+    timed('insert', n_ops, insert)
+
+    sample = [rng.choice(cells) for i in range(n_ops)]
+    def index():
+        for cell in sample:
+            ws.index(cell)
+    timed('index', n_ops, index)
+
+    positions = [rng.randint(0, ws.n_cells() - 1) for i in range(n_ops)]
+    def getitem():
+        for pos in positions:
+            ws[pos]
+    timed('getitem', n_ops, getitem)
+
+    def delete():
+        for cell in new_cells:
+            ws.delete(cell)
+    timed('delete', n_ops, delete)
+
+    def iterate():
+        for cell in ws:
+            pass
+    timed('iterate', ws.n_cells(), iterate)
+    assert ws.n_cells() == n_cells
+
+
+def max_rss():
+    """
+    Return the peak memory use of the process in kilobytes
+    """
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark_cell_widgets(n_widgets=200):
+    """
+    Time the construction of GTK cell widgets
+    """
+    from sage_notebook.view.gtk.cell_widget import CellWidget
+    def callback(*args):
+        return False
+    def make_widget():
+        return CellWidget(callback, callback, callback, callback, callback)
+    cell = Cell()
+    cell.input = 'factor(2^64 - 1)'
+    start = time.time()
+    make_widget().update(cell)
+    print('{0:>12}: {1:8.2f} ms'.format('first', 1e3 * (time.time() - start)))
+    widgets = []
+    rss = max_rss()
+    def construct():
+        for i in range(n_widgets):
+            widget = make_widget()
+            widget.update(cell)
+            widgets.append(widget)
+    timed('construct', n_widgets, construct)
+    print('{0:>12}: {1:8.2f} kB/widget'.format(
+        'memory', float(max_rss() - rss) / n_widgets))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] == 'widgets':
+        n_widgets = int(args[1]) if len(args) > 1 else 200
+        benchmark_cell_widgets(n_widgets)
+    else:
+        n_cells = int(args[0]) if args else 100000
+        benchmark_worksheet(n_cells)
@@ -1,14 +1,113 @@
 $(document).ready(function(){                                            
     $('form').submit(function(event){                                    
-        ws.send($('#input').val())                                        
+        // evaluate the input in the last cell of the worksheet
+        var cell_id = $("#cells").children().last().attr("data-cell-id");
+        send([{kind: "eval", cell_id: cell_id, input: $('#input').val()}]);
         return false;                                                    
     });                                                                  
+    $("#cells").on("click", "a.elided", function(event) {
+        load_elided($(this));
+        return false;
+    });
     if ("WebSocket" in window) {                                         
-        ws = new WebSocket("ws://" + document.domain + ":5000/notebook/ws");                
-        ws.onmessage = function (msg) {                                  
-            $("#output").append("<div>"+msg.data+"</div>")                      
-        };                                      
+        last_seq = $("#cells").data("seq");
+        connect();
     } else {                                                             
         alert("WebSocket not supported");                                
     }                                                                    
 });                                                                      
+
+function connect() {
+    // the server replays the messages after last_seq
+    ws = new WebSocket("ws://" + document.domain + ":5000/notebook/ws?last_seq=" + last_seq);
+    ws.onmessage = function (msg) {                                  
+        var frame = JSON.parse(msg.data);
+        for (var i = 0; i < frame.length; i++) {
+            if (frame[i].seq <= last_seq) {
+                continue;
+            }
+            receive(frame[i]);
+            if (frame[i].seq !== undefined) {
+                last_seq = frame[i].seq;
+            }
+        }
+    };                                      
+    ws.onclose = function () {
+        setTimeout(connect, 1000);
+    };
+}
+
+function send(messages) {
+    ws.send(JSON.stringify(messages));
+}
+
+function cell_output(cell_id) {
+    var cell = $("#cells").children().filter(function() {
+        return $(this).attr("data-cell-id") == cell_id;
+    });
+    return cell.children(".output");
+}
+
+function receive(data) {
+    if (data.kind == "state") {
+        if (data.state == "busy") {
+            cell_output(data.cell_id).empty();
+        }
+    } else if (data.kind == "output-append") {
+        var output = cell_output(data.cell_id);
+        if (data.tail_size !== undefined) {
+            append_elided(output, data);
+        } else {
+            output.append(document.createTextNode(data.text));
+        }
+    } else if (data.kind == "output-elided") {
+        show_elided(cell_output(data.cell_id), data);
+    } else if (data.kind == "inserted") {
+        var element = $("<div></div>").attr("data-cell-id", data.cell_id);
+        element.append($("<pre class='input'></pre>").text(data.input));
+        element.append($("<pre class='output'></pre>"));
+        insert_cell(data.pos, element);
+    } else if (data.kind == "deleted") {
+        $("#cells").children().eq(data.pos).remove();
+    } else if (data.kind == "moved") {
+        insert_cell(data.new_pos, $("#cells").children().eq(data.old_pos).detach());
+    } else if (data.kind == "resync") {
+        location.reload();
+    }
+}
+
+function insert_cell(pos, element) {
+    var cells = $("#cells").children();
+    if (pos < cells.length) {
+        cells.eq(pos).before(element);
+    } else {
+        $("#cells").append(element);
+    }
+}
+
+function load_elided(marker) {
+    var cell_id = marker.closest("[data-cell-id]").attr("data-cell-id");
+    $.get("/notebook/elided/" + cell_id, function(text) {
+        marker.replaceWith(document.createTextNode(text));
+    });
+}
+
+function show_elided(output, data) {
+    var marker = $("<a href='#'></a>").text("[" + data.elided_lines + " lines elided]");
+    output.empty();
+    output.append(document.createTextNode(data.head));
+    output.append(marker.addClass("elided"));
+    output.append($("<span class='tail'></span>").text(data.tail));
+}
+
+function append_elided(output, data) {
+    // only the end of the tail is still kept on the server
+    var tail = output.children(".tail");
+    var text = tail.text() + data.text;
+    var marker = output.children(".elided");
+    if (marker.length > 0) {
+        text = text.substring(text.length - data.tail_size);
+        marker.text("[" + data.elided_lines + " lines elided]");
+    }
+    tail.text(text);
+}
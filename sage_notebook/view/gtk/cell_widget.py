@@ -27,6 +27,7 @@ from gi.repository import GtkSource
 import cairo
 
 from .code_completion import SageCompletionProvider
+from . import resources
 from .fonts import MATH_SYMBOL_FONT
 
 
@@ -55,6 +56,20 @@ class CellVerticalSpacerWidget(Gtk.EventBox):
         widget.set_state(Gtk.StateFlags.NORMAL) 
 
 
+class CellPlaceholderWidget(Gtk.DrawingArea):
+    __gtype_name__ = 'CellPlaceholderWidget'
+
+    def __init__(self, *args, **kwds):
+        """
+        Empty space standing in for cells that are scrolled out of view
+        """
+        super(CellPlaceholderWidget, self).__init__(*args, **kwds)
+        self.set_height(0)
+
+    def set_height(self, height):
+        self.set_size_request(-1, max(0, int(height)))
+
+
 class CellLabelWidget(Gtk.Label):
     __gtype_name__ = 'CellLabelWidget'
     
@@ -155,12 +170,19 @@ class CellWidget(Gtk.Grid):
 
     def __init__(self, key_press_event_callback, 
                  focus_in_event_callback, focus_out_event_callback,
-                 code_complete_callback,
+                 code_complete_callback, load_elided_output_callback,
                  *args, **kwds):
         self._key_press_event_callback = key_press_event_callback
         self._focus_in_event_callback = focus_in_event_callback
         self._focus_out_event_callback = focus_out_event_callback
         self._code_complete_callback = code_complete_callback
+        self._load_elided_output_callback = load_elided_output_callback
+        self._id = None
+        self._output_offset = 0
+        self._elided = False
+        self._elided_anchor = None
+        self._elided_button = None
+        self._tail_shown = 0
         super(CellWidget, self).__init__(*args, **kwds)
         self.set_row_homogeneous(False)
         self.set_column_homogeneous(False)
@@ -200,11 +222,9 @@ class CellWidget(Gtk.Grid):
         view.connect("focus-in-event", self._focus_in_event_callback)
         view.connect("focus-out-event", self._focus_out_event_callback)
         buffer = self.in_buffer = GtkSource.Buffer()
-        style = GtkSource.StyleSchemeManager().get_scheme('tango')
-        buffer.set_style_scheme(style)
+        buffer.set_style_scheme(resources.style_scheme('tango'))
         view.set_buffer(buffer)
-        fontdesc = Pango.FontDescription("Consolas 13")
-        view.modify_font(fontdesc)
+        view.modify_font(resources.font('Consolas 13'))
         self.set_language()
         view.set_hexpand(True)
         view.set_vexpand(False)
@@ -258,8 +278,7 @@ class CellWidget(Gtk.Grid):
         buffer = self.out_buffer = Gtk.TextBuffer()
         buffer.set_text('output')
         view.set_buffer(buffer)
-        fontdesc = Pango.FontDescription("monospace")
-        view.modify_font(fontdesc)
+        view.modify_font(resources.font('monospace'))
         #view.set_border_window_size(Gtk.TextWindowType.TOP, INPUT_OUTPUT_VSPACE)
         view.set_hexpand(True)
         view.set_vexpand(False)
@@ -269,19 +288,123 @@ class CellWidget(Gtk.Grid):
         return label, view
 
     def set_output(self, cell):
+        """
+        Replace the displayed output with the cell's output
+        """
         self.set_index(cell.index)
-        output = cell.as_plain_text()
-        self.out_buffer.set_text(output)
-        if len(output.strip()) > 0:
+        self._elided = False
+        self._elided_anchor = self._elided_button = None
+        if cell.output.is_elided():
+            self._set_elided_output(cell.output)
+        else:
+            output, self._output_offset = cell.output_delta()
+            self.out_buffer.set_text(output)
+        self._update_output_visibility()
+
+    def _set_elided_output(self, output):
+        """
+        Display head and tail of a huge output
+
+        The elided middle is replaced by a button to load it. This
+        is only drawn once, later updates go through
+        :meth:`_append_elided_output`.
+        """
+        buf = self.out_buffer
+        buf.set_text(output.head())
+        self._elided = True
+        self._elided_anchor = anchor = buf.create_child_anchor(buf.get_end_iter())
+        self._elided_button = button = Gtk.Button(label=self._elided_label(output))
+        button.set_relief(Gtk.ReliefStyle.NONE)
+        button.connect('clicked', self.on_elided_output_clicked)
+        self.out_view.add_child_at_anchor(button, anchor)
+        button.show()
+        start = output.tail_offset
+        self._output_offset = output.stripped_size(start)
+        tail = output.get(start, self._output_offset)
+        buf.insert(buf.get_end_iter(), tail)
+        self._tail_shown = len(tail)
+
+    def _elided_label(self, output):
+        return '{0} lines elided'.format(output.elided_lines)
+
+    def _append_elided_output(self, output):
+        """
+        Display the new output of a huge output
+
+        Only the new part of the tail is inserted, and the displayed
+        tail is trimmed to what the output buffer still keeps in
+        memory. Output that was elided before it could be displayed
+        is skipped.
+        """
+        anchor = self._elided_anchor
+        collapsed = anchor is not None and not anchor.get_deleted()
+        tail_offset = output.tail_offset
+        start = self._output_offset
+        if collapsed:
+            start = max(start, tail_offset)
+        self._output_offset = end = output.stripped_size(start)
+        buf = self.out_buffer
+        text = output.get(start, end)
+        if len(text) > 0:
+            buf.insert(buf.get_end_iter(), text)
+            self._tail_shown += len(text)
+        if not collapsed:
+            return   # the elided part was loaded, show everything
+        excess = self._tail_shown - max(0, end - tail_offset)
+        if excess > 0:
+            first = buf.get_iter_at_child_anchor(anchor)
+            first.forward_char()
+            last = first.copy()
+            last.forward_chars(excess)
+            buf.delete(first, last)
+            self._tail_shown -= excess
+        label = self._elided_label(output)
+        if self._elided_button.get_label() != label:
+            self._elided_button.set_label(label)
+
+    def on_elided_output_clicked(self, button):
+        anchor = self._elided_anchor
+        if anchor is None or anchor.get_deleted():
+            return
+        self._elided_anchor = self._elided_button = None
+        text = self._load_elided_output_callback(self._id)
+        buf = self.out_buffer
+        start = buf.get_iter_at_child_anchor(anchor)
+        end = start.copy()
+        end.forward_char()
+        buf.delete(start, end)
+        buf.insert(start, text)
+
+    def append_output(self, cell):
+        """
+        Display the output that was added since the last update
+
+        Only the new output is inserted into the text buffer. Of huge
+        outputs only the head and the tail are shown.
+        """
+        if self._elided:
+            self._append_elided_output(cell.output)
+            self._update_output_visibility()
+            return
+        if cell.output.is_elided():
+            self._set_elided_output(cell.output)
+            self._update_output_visibility()
+            return
+        output, self._output_offset = cell.output_delta(self._output_offset)
+        if len(output) > 0:
+            buf = self.out_buffer
+            buf.insert(buf.get_end_iter(), output)
+        self._update_output_visibility()
+
+    def _update_output_visibility(self):
+        if self._output_offset > 0:
             self.out_view.show()
         else:
             self.out_view.hide()
             self.out_label.hide()
         
     def set_language(self, language='python'):
-        mgr = GtkSource.LanguageManager()
-        lang = mgr.get_language(language)
-        self.in_buffer.set_language(lang)
+        self.in_buffer.set_language(resources.language(language))
         view = self.in_view
         view.set_insert_spaces_instead_of_tabs(True)
         view.set_tab_width(4)
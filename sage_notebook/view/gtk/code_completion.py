@@ -4,6 +4,8 @@ Code Completion for GtkSourceView
 
 from gi.repository import GObject, Gtk, GtkSource
 
+from . import resources
+
 
 
 AUTOCOMPLETE_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_%.'
@@ -42,8 +44,7 @@ class SageCompletionProvider(GObject.Object, GtkSource.CompletionProvider):
         GObject.Object.__init__(self)
         self.cell_widget = cell_widget
         self.priority = 1
-        theme = Gtk.IconTheme.get_default()
-        self.icon = theme.load_icon(Gtk.STOCK_DIALOG_INFO, 16, 0)
+        self.icon = resources.icon(Gtk.STOCK_DIALOG_INFO, 16)
         self.counter = 0
         self.context = None
 
@@ -0,0 +1,114 @@
+"""
+Shared GTK Resources
+
+Language definitions, style schemes, fonts, icons and CSS providers
+are immutable once created, so all widgets can share them. Each of
+them is created only once per process and then cached here. This keeps
+the construction of cell widgets cheap, which matters for worksheets
+with many cells.
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+from gi.repository import Gdk, Gtk, Pango
+from gi.repository import GtkSource
+
+
+_cache = dict()
+
+
+def _cached(func):
+    """
+    Decorator to cache the result for each combination of arguments
+    """
+    def wrapper(*args):
+        key = (func.__name__,) + args
+        try:
+            return _cache[key]
+        except KeyError:
+            result = _cache[key] = func(*args)
+            return result
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+@_cached
+def language(name='python'):
+    """
+    Return the ``GtkSource.Language`` for syntax highlighting
+    """
+    return GtkSource.LanguageManager.get_default().get_language(name)
+
+
+@_cached
+def style_scheme(name='tango'):
+    """
+    Return the ``GtkSource.StyleScheme`` with the given name
+    """
+    return GtkSource.StyleSchemeManager.get_default().get_scheme(name)
+
+
+@_cached
+def font(description):
+    """
+    Return the ``Pango.FontDescription`` for the font description string
+    """
+    return Pango.FontDescription(description)
+
+
+@_cached
+def icon(name, size=16):
+    """
+    Return the icon from the default theme as ``GdkPixbuf.Pixbuf``
+    """
+    return Gtk.IconTheme.get_default().load_icon(name, size, 0)
+
+
+@_cached
+def css_provider(css):
+    """
+    Return a ``Gtk.CssProvider`` for the css data
+
+    INPUT:
+
+    - ``css`` -- bytes. The style sheet.
+    """
+    provider = Gtk.CssProvider()
+    provider.load_from_data(css)
+    return provider
+
+
+@_cached
+def install_css(css):
+    """
+    Apply the style sheet to the whole screen
+
+    Repeated calls with the same style sheet do nothing.
+
+    INPUT:
+
+    - ``css`` -- bytes. The style sheet.
+    """
+    Gtk.StyleContext.add_provider_for_screen(
+        Gdk.Screen.get_default(),
+        css_provider(css),
+        Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+    )
+    return True
@@ -0,0 +1,244 @@
+"""
+Message Protocol of the Notebook Websocket
+
+The browser and the server exchange JSON frames on the websocket. A
+frame is a list of messages, so many updates can be sent at once. Each
+message is a dictionary with a ``kind`` and, if it concerns a cell, a
+``cell_id``. Messages from the server additionally carry a sequence
+number ``seq`` that increases by one with every message.
+
+Messages from the browser:
+
+- ``eval`` -- evaluate the ``input`` of cell ``cell_id``.
+
+- ``complete`` -- complete the ``input`` of cell ``cell_id`` at the
+  cursor position ``pos``. The reply is a ``completions`` message with
+  the same ``label``.
+
+Messages from the server:
+
+- ``output-append`` -- append ``text`` at ``offset`` to the output.
+  If the output is elided, ``tail_size`` is the number of characters
+  of the tail to keep displayed and ``elided_lines`` is the new size
+  of the elided part.
+
+- ``output-elided`` -- replace the output by ``head``, a marker for
+  ``elided_lines`` lines, and ``tail``.
+
+- ``state`` -- the cell changed its ``state`` to ``busy`` or
+  ``finished``.
+
+- ``inserted``, ``deleted``, ``moved`` -- structural edits of the
+  worksheet.
+
+- ``completions`` -- the reply to a ``complete`` message.
+
+- ``resync`` -- the browser fell behind and has to reload.
+
+The last messages that were sent are remembered. A browser that lost
+its connection reconnects with the sequence number of the last
+message it saw, and only the messages that it missed are sent again
+(see :meth:`FrameBuffer.replay`).
+
+EXAMPLES::
+
+    sage: from sage_notebook.view.notebook_protocol import FrameBuffer, decode_frame
+    sage: frames = FrameBuffer()
+    sage: frames.add('state', 'cell-1', state='busy')
+    sage: frames.add('output-append', 'cell-1', offset=0, text='2\\n')
+    sage: print(frames.flush())
+    [{"cell_id":"cell-1","kind":"state","seq":1,"state":"busy"},{"cell_id":"cell-1","kind":"output-append","offset":0,"seq":2,"text":"2\\n"}]
+    sage: frames.flush() is None
+    True
+    sage: message, = decode_frame('[{"kind": "eval", "cell_id": "cell-1", "input": "1+1"}]')
+    sage: sorted(message.items())
+    [('cell_id', 'cell-1'), ('input', '1+1'), ('kind', 'eval')]
+    sage: decode_frame('{"kind": "shutdown"}')
+    Traceback (most recent call last):
+    ...
+    ValueError: unknown message kind: 'shutdown'
+    sage: decode_frame('{"kind": "eval", "cell_id": null, "input": "1+1"}')
+    Traceback (most recent call last):
+    ...
+    ValueError: eval message with invalid cell_id
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import collections
+import json
+
+
+try:
+    _STRING = (str, unicode)
+except NameError:
+    _STRING = (str,)
+
+# Inbound message kinds, their required fields and the field types
+# (``None`` accepts anything)
+INBOUND = {
+    'eval': (('cell_id', _STRING), ('input', _STRING)),
+    'complete': (('cell_id', _STRING), ('input', _STRING), ('pos', (int,)), ('label', None)),
+}
+
+
+def encode_frame(messages):
+    """
+    Return the JSON frame for a list of messages
+    """
+    return json.dumps(messages, separators=(',', ':'), sort_keys=True)
+
+
+def decode_frame(data):
+    """
+    Parse a frame sent by the browser
+
+    INPUT:
+
+    - ``data`` -- string. A JSON list of messages, or a single
+      message.
+
+    OUTPUT:
+
+    The list of messages. A ``ValueError`` is raised if the frame is
+    malformed.
+    """
+    messages = json.loads(data)
+    if isinstance(messages, dict):
+        messages = [messages]
+    if not isinstance(messages, list):
+        raise ValueError('frame must be a list of messages')
+    for message in messages:
+        if not isinstance(message, dict):
+            raise ValueError('message must be an object')
+        kind = message.get('kind')
+        try:
+            fields = INBOUND[kind]
+        except (KeyError, TypeError):
+            raise ValueError('unknown message kind: {0!r}'.format(str(kind)))
+        for field, types in fields:
+            if field not in message:
+                raise ValueError('{0} message without {1}'.format(kind, field))
+            if types is not None and not isinstance(message[field], types):
+                raise ValueError('{0} message with invalid {1}'.format(kind, field))
+    return messages
+
+
+class FrameBuffer(object):
+
+    def __init__(self, history=1000):
+        """
+        Collect outgoing messages until they are sent as one frame
+
+        INPUT:
+
+        - ``history`` -- integer. The number of sent messages that are
+          kept for :meth:`replay`.
+        """
+        self._seq = 0
+        self._messages = []
+        self._history = collections.deque(maxlen=history)
+
+    @property
+    def seq(self):
+        """
+        The sequence number of the last message
+        """
+        return self._seq
+
+    @property
+    def sent_seq(self):
+        """
+        The sequence number of the last message that was flushed
+        """
+        return self._seq - len(self._messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, kind, cell_id=None, **fields):
+        """
+        Queue a message
+
+        INPUT:
+
+        - ``kind`` -- string. The message kind.
+
+        - ``cell_id`` -- the cell that the message is about, if any.
+
+        - ``**fields`` -- the message data. Must be serializable as
+          JSON.
+        """
+        self._seq += 1
+        fields.update(kind=kind, seq=self._seq)
+        if cell_id is not None:
+            fields['cell_id'] = cell_id
+        self._messages.append(fields)
+
+    def flush(self):
+        """
+        Return the frame with all queued messages
+
+        OUTPUT:
+
+        String. Or ``None`` if there are no messages.
+        """
+        if not self._messages:
+            return None
+        messages, self._messages = self._messages, []
+        self._history.extend(messages)
+        return encode_frame(messages)
+
+    def replay(self, last_seq):
+        """
+        Return the frame with the sent messages after ``last_seq``
+
+        INPUT:
+
+        - ``last_seq`` -- integer. The sequence number of the last
+          message that the browser received.
+
+        OUTPUT:
+
+        String. Or ``None`` if some of the missed messages are no
+        longer remembered, in which case the browser has to reload.
+        Messages that were not flushed yet are not included, they
+        will be sent with the next frame.
+
+        EXAMPLES::
+
+            sage: from sage_notebook.view.notebook_protocol import FrameBuffer
+            sage: frames = FrameBuffer(history=2)
+            sage: for i in range(3):
+            ....:     frames.add('output-append', 'cell-1', text=str(i))
+            ....:     _ = frames.flush()
+            sage: frames.add('state', 'cell-1', state='finished')
+            sage: print(frames.replay(2))
+            [{"cell_id":"cell-1","kind":"output-append","seq":3,"text":"2"}]
+            sage: print(frames.replay(3))
+            []
+            sage: frames.replay(0) is None
+            True
+        """
+        sent_seq = self.sent_seq
+        if last_seq > sent_seq or sent_seq - last_seq > len(self._history):
+            return None
+        n = sent_seq - last_seq
+        missed = list(self._history)[len(self._history) - n:] if n > 0 else []
+        return encode_frame(missed)
@@ -65,6 +65,28 @@ class NotebookWindowABC(WindowABC):
         """
         raise NotImplementedError
 
+    def cell_inserted(self, pos, cell):
+        """
+        Display the new ``cell`` at position ``pos``
+
+        This and the other structural edits are applied to the
+        worksheet that was passed to :meth:`set_worksheet`, which
+        already reflects the change.
+        """
+        raise NotImplementedError
+
+    def cell_deleted(self, pos, cell):
+        """
+        Stop displaying ``cell``, which was at position ``pos``
+        """
+        raise NotImplementedError
+
+    def cell_moved(self, old_pos, new_pos, cell):
+        """
+        Display ``cell`` at ``new_pos`` instead of ``old_pos``
+        """
+        raise NotImplementedError
+
     def cell_grab_focus(self, cell):
         """
         Focus cell and put cursor into the cell's input field
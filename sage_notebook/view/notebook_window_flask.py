@@ -23,24 +23,131 @@ This is the Flask implementation of :mod:`notebook_window`
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ##############################################################################
 
+import collections
+import hashlib
 import logging
+logger = logging.getLogger('GUI')
+
 import flask
 
 from .window_flask import WindowFlaskSocket
 from .notebook_window import NotebookWindowABC
+from .notebook_protocol import FrameBuffer, decode_frame, encode_frame
 
 
 class NotebookWindowFlask(NotebookWindowABC, WindowFlaskSocket):
 
     def __init__(self, presenter):
         WindowFlaskSocket.__init__(self, 'notebook', presenter)
-        self.cells = []
+        self._worksheet = None
+        self._fragments = collections.OrderedDict()
+        self.max_fragments = 10000
+        self._output_offsets = dict()
+        self._elided_cells = dict()
+        self._frames = FrameBuffer()
+
+    def resync_message(self, client):
+        """
+        Tell the browser to reload the page
+        """
+        return encode_frame([dict(kind='resync')])
+
+    def on_connect(self, client):
+        """
+        Send the messages that the browser missed
+
+        The browser passes the sequence number of the last message it
+        has seen as ``last_seq`` parameter of the websocket url. If the
+        missed messages are no longer remembered, the browser is told
+        to reload instead.
+        """
+        last_seq = flask.request.args.get('last_seq', type=int)
+        if last_seq is None:
+            return
+        frame = self._frames.replay(last_seq)
+        if frame is None:
+            logger.info('cannot resume websocket at %s, resync', last_seq)
+            client.put(self.resync_message(client))
+        else:
+            client.put(frame)
 
     def on_receive(self, message):
-        self.on_notebook_evaluate_cell(self._tmp_cell_id, message)
+        """
+        Handle a frame from the browser
+
+        See :mod:`~sage_notebook.view.notebook_protocol` for the
+        message kinds. Frames that cannot be decoded and messages
+        about cells that are not in the worksheet are dropped.
+        """
+        try:
+            messages = decode_frame(message)
+        except ValueError as error:
+            logger.warning('dropping invalid websocket frame: %s', error)
+            return
+        for msg in messages:
+            ws = self._worksheet
+            if ws is None or not ws.has_cell_id(msg['cell_id']):
+                logger.warning('dropping %s message for unknown cell %s',
+                               msg['kind'], msg['cell_id'])
+            elif msg['kind'] == 'eval':
+                self.on_notebook_evaluate_cell(msg['cell_id'], msg['input'])
+            elif msg['kind'] == 'complete':
+                self.on_notebook_cell_code_complete(
+                    msg['input'], msg['pos'], msg['cell_id'], msg['label'])
+
+    def send_message(self, kind, cell, **kwds):
+        """
+        Send a message about ``cell`` on the websocket
+
+        The messages are collected and sent as one frame when control
+        returns to the main loop.
+        """
+        self._queue_message(kind, cell.id, **kwds)
+
+    def _queue_message(self, kind, cell_id=None, **kwds):
+        if len(self._frames) == 0:
+            self.presenter.main_loop.call_later(0, self._send_frame)
+        self._frames.add(kind, cell_id, **kwds)
+
+    def _send_frame(self):
+        frame = self._frames.flush()
+        if frame is not None:
+            self.send(frame)
 
     def set_output(self, cell):
-        self.send(cell.as_plain_text())
+        """
+        Send the output that was added since the last update
+
+        The ``offset`` of the ``append`` message is the position of
+        the text in the cell's output. Once the output is elided, its
+        head and tail are sent once. After that only the new part of
+        the tail is sent, together with the size to which the browser
+        trims the displayed tail.
+        """
+        output = cell.output
+        offset = self._output_offsets.get(cell.id, 0)
+        if cell.id in self._elided_cells:
+            tail_offset = output.tail_offset
+            start = max(offset, tail_offset)
+            end = self._output_offsets[cell.id] = output.stripped_size(start)
+            text = output.get(start, end)
+            if len(text) > 0 or tail_offset != self._elided_cells[cell.id]:
+                self._elided_cells[cell.id] = tail_offset
+                self.send_message('output-append', cell, offset=start, text=text,
+                                  tail_size=max(0, end - tail_offset),
+                                  elided_lines=output.elided_lines)
+            return
+        if output.is_elided():
+            start = self._elided_cells[cell.id] = output.tail_offset
+            end = self._output_offsets[cell.id] = output.stripped_size(start)
+            self.send_message('output-elided', cell,
+                              head=output.head(),
+                              tail=output.get(start, end),
+                              elided_lines=output.elided_lines)
+            return
+        text, self._output_offsets[cell.id] = cell.output_delta(offset)
+        if len(text) > 0:
+            self.send_message('output-append', cell, offset=offset, text=text)
 
     def set_worksheet(self, worksheet):
         """
@@ -51,16 +158,103 @@ class NotebookWindowFlask(NotebookWindowABC, WindowFlaskSocket):
         - ``worksheet`` -- A
           :class:`~sage_notebok.model.worksheet.Worksheet`.
         """
-        for cell in worksheet:
-            self.cells.append('--- {0}\n{1}'.format(cell, cell.input))
-        # TODO: remove _tmp_cell_id
-        self._tmp_cell_id = cell.id
+        self._worksheet = worksheet
+        self._fragments.clear()
+        # open pages (and replays) show the previous worksheet
+        self._queue_message('resync')
+
+    def _fragment_key(self, cell):
+        return (cell.input, cell.output_version,
+                self._output_offsets.get(cell.id), self._elided_cells.get(cell.id))
+
+    def _displayed_output(self, cell):
+        """
+        Return the output of the cell as the browser shows it
+
+        The output of a running cell is only rendered up to the
+        offset that the websocket messages continue from, and elided
+        output gets the markup of the ``output-elided`` message.
+
+        OUTPUT:
+
+        A dictionary with either the ``text`` or the ``head``,
+        ``elided_lines`` and ``tail`` of the output.
+        """
+        output = cell.output
+        offset = self._output_offsets.get(cell.id)
+        if offset is None:
+            if not output.is_elided():
+                return dict(text=cell.as_plain_text())
+            start = output.tail_offset
+            end = output.stripped_size(start)
+        elif cell.id in self._elided_cells:
+            start = self._elided_cells[cell.id]
+            end = offset
+        else:
+            return dict(text=output.get(0, offset))
+        return dict(head=output.head(), elided_lines=output.elided_lines,
+                    tail=output.get(start, end))
+
+    def _render_cell(self, cell):
+        """
+        Return the html for the cell
+
+        The html is cached until the input or the output of the cell
+        changes. Must be called while handling a request.
+        """
+        key = self._fragment_key(cell)
+        try:
+            cached_key, html = self._fragments.pop(cell.id)
+        except KeyError:
+            cached_key = html = None
+        if cached_key != key:
+            html = flask.render_template('cell.html', cell=cell,
+                                         output=self._displayed_output(cell))
+        self._fragments[cell.id] = (key, html)
+        if len(self._fragments) > self.max_fragments:
+            self._fragments.popitem(last=False)
+        return html
+
+    def _page_etag(self, seq):
+        """
+        Return the entity tag of the notebook page
+
+        This is cheap compared to rendering the page.
+        """
+        digest = hashlib.sha1(str(seq).encode('utf-8'))
+        for cell in self._worksheet:
+            input_digest = hashlib.sha1(cell.input.encode('utf-8')).hexdigest()
+            digest.update(repr((cell.id, input_digest, cell.output_version)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def cell_inserted(self, pos, cell):
+        """
+        Display the new ``cell`` at position ``pos``
+        """
+        self.send_message('inserted', cell, pos=pos, input=cell.input)
+
+    def cell_deleted(self, pos, cell):
+        """
+        Stop displaying ``cell``, which was at position ``pos``
+        """
+        self._fragments.pop(cell.id, None)
+        self._output_offsets.pop(cell.id, None)
+        self._elided_cells.pop(cell.id, None)
+        self.send_message('deleted', cell, pos=pos)
+
+    def cell_moved(self, old_pos, new_pos, cell):
+        """
+        Display ``cell`` at ``new_pos`` instead of ``old_pos``
+        """
+        self.send_message('moved', cell, old_pos=old_pos, new_pos=new_pos)
 
     def cell_busy(self, cell):
         """
         Update the view of the cell to display a running computation.
         """
-        self.send('busy')
+        self._output_offsets[cell.id] = 0
+        self._elided_cells.pop(cell.id, None)
+        self.send_message('state', cell, state='busy')
 
     def cell_update(self, cell):
         """
@@ -73,7 +267,56 @@ class NotebookWindowFlask(NotebookWindowABC, WindowFlaskSocket):
         Update the view of the cell to display the final result
         """
         self.set_output(cell)
-        self.send('finished')
+        del self._output_offsets[cell.id]
+        self._elided_cells.pop(cell.id, None)
+        self.send_message('state', cell, state='finished', index=cell.index,
+                          interrupted=cell.interrupted)
+
+    def code_complete_finished(self, cell, completion):
+        """
+        Send the completions to the browser
+        """
+        self.send_message('completions', cell,
+                          label=completion.request.label,
+                          base=completion.base,
+                          completions=list(completion.completions))
+
+    @property
+    def url_elided(self):
+        return self.url + 'elided/<cell_id>'
+
+    def dispatch_elided(self, cell_id):
+        """
+        Return the elided part of a huge output as plain text
+        """
+        text = self.presenter.load_elided_output(cell_id)
+        return flask.Response(text, mimetype='text/plain')
+
+    def add_url_rule_to(self, app):
+        super(NotebookWindowFlask, self).add_url_rule_to(app)
+        app.add_url_rule(self.url_elided, self.name + '_elided', self.dispatch_elided)
 
     def dispatch_request(self):
-        return flask.render_template(self.name + '.html', cells=self.cells) 
+        """
+        Return the notebook page
+
+        The page is assembled from the cached html of the cells. The
+        browser is asked to revalidate its copy with the entity tag,
+        and gets an empty "304 Not Modified" reply if the page did not
+        change.
+        """
+        if self._worksheet is None:
+            return flask.abort(503, 'No worksheet loaded.')
+        # the page must not contain changes that are still to be sent
+        self._send_frame()
+        seq = self._frames.sent_seq
+        etag = self._page_etag(seq)
+        if etag in flask.request.if_none_match:
+            response = flask.Response(status=304)
+        else:
+            cells = [self._render_cell(cell) for cell in self._worksheet]
+            response = flask.make_response(flask.render_template(
+                self.name + '.html', cells=cells, seq=seq))
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
@@ -29,8 +29,9 @@ from gi.repository import Gdk, Gtk, Pango
 
 from .window_gtk import WindowGtk
 from .notebook_window import NotebookWindowABC
+from .gtk import resources
 from .gtk.cell_widget import (
-    CellVerticalSpacerWidget, CellWidget
+    CellVerticalSpacerWidget, CellWidget, CellPlaceholderWidget
 )
 
 # background-color: rgba (0,0,0,1); 
@@ -49,6 +50,21 @@ TOOLBUTTON_RUN = 'notebook_toolbutton_run'
 TOOLBUTTON_STOP = 'notebook_toolbutton_stop'
 TOOLBUTTON_SPINNER = 'notebook_toolbutton_spinner'
 
+SCROLLED_WINDOW = 'notebook_scrolledwindow'
+
+# Only this many cell widgets are created, they are recycled to
+# display the cells near the visible part of the worksheet. This
+# must be comfortably larger than the number of cells that fit on the
+# screen.
+WINDOW_ROWS = 40
+
+# Number of rows to keep above the visible part when moving the window
+OVERSCAN = 10
+
+# Guess for the height of a cell (including spacer) before we can
+# measure it
+DEFAULT_ROW_HEIGHT = 100
+
 
 NOTEBOOK_STYLE_CSS = """
 #{title} {{
@@ -114,8 +130,15 @@ class CellsModel(object):
     def __init__(self):
         """
         Container for the cell widgets
+
+        Widgets are indexed both by position and by the id of the cell
+        that they display, so finding the widget for a cell does not
+        depend on the number of cells.
         """
         self._data = []
+        self._positions = dict()
+        self._by_id = dict()
+        self.first = 0
 
     def __iter__(self):
         for widget in self._data:
@@ -128,13 +151,57 @@ class CellsModel(object):
         return self._data[pos]
 
     def append(self, widget):
+        self._positions[widget] = len(self._data)
         self._data.append(widget)
+        self._add_id(widget)
+
+    def insert(self, pos, widget):
+        self._data.insert(pos, widget)
+        for i in range(pos, len(self._data)):
+            self._positions[self._data[i]] = i
+        self._add_id(widget)
 
     def index(self, widget):
-        return self._data.index(widget)
+        """
+        Return the position of the widget among the cell widgets
+        """
+        return self._positions[widget]
+
+    def row(self, widget):
+        """
+        Return the position in the worksheet of the cell displayed
+        """
+        return self.first + self._positions[widget]
 
     def remove(self, widget):
-        self._data.remove(widget)
+        pos = self._positions.pop(widget)
+        del self._data[pos]
+        for i in range(pos, len(self._data)):
+            self._positions[self._data[i]] = i
+        if self._by_id.get(widget.id, None) is widget:
+            del self._by_id[widget.id]
+
+    def _add_id(self, widget):
+        if widget.id is not None:
+            self._by_id[widget.id] = widget
+
+    def update(self, widget, cell):
+        """
+        Display ``cell`` in ``widget``
+
+        This must be used instead of calling ``widget.update(cell)``
+        directly to keep the cell id index in sync.
+
+        INPUT:
+
+        - ``widget`` -- a cell widget in the model.
+
+        - ``cell`` -- a cell of the notebook data model
+        """
+        if self._by_id.get(widget.id, None) is widget:
+            del self._by_id[widget.id]
+        widget.update(cell)
+        self._add_id(widget)
 
     def find(self, cell):
         """
@@ -144,10 +211,20 @@ class CellsModel(object):
 
         - ``cell`` -- a cell of the notebook data model
         """
-        for widget in self._data:
-            if widget.id == cell.id:
-                return widget
-        raise IndexError('no widget for cell')
+        return self.find_id(cell.id)
+
+    def find_id(self, cell_id):
+        """
+        Find the widget displaying the cell with the given id
+
+        Only cells near the visible part of the worksheet are
+        displayed by a widget. An ``IndexError`` is raised for other
+        cells.
+        """
+        try:
+            return self._by_id[cell_id]
+        except KeyError:
+            raise IndexError('no widget for cell')
         
     def find_prev_sensitive(self, cell):
         """
@@ -202,7 +279,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         builder = make_builder(
             WINDOW, TITLE, DESCRIPTION_VIEW, DESCRIPTION_MODEL, CELLS,
             MENU_INSERT_BEFORE, MENU_INSERT_AFTER, MENU_CELL_DELETE,
-            TOOLBUTTON_RUN, TOOLBUTTON_STOP, TOOLBUTTON_SPINNER)
+            TOOLBUTTON_RUN, TOOLBUTTON_STOP, TOOLBUTTON_SPINNER, SCROLLED_WINDOW)
         WindowGtk.__init__(self, WINDOW, presenter, builder=builder)
         self.menu_insert_before = builder.get_object(MENU_INSERT_BEFORE)
         self.menu_insert_after = builder.get_object(MENU_INSERT_AFTER)
@@ -213,14 +290,9 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         self._init_title(builder.get_object(TITLE))
         self._init_description(builder.get_object(DESCRIPTION_VIEW),
                                builder.get_object(DESCRIPTION_MODEL))
-        self._init_cells(builder.get_object(CELLS))
-        style_provider = Gtk.CssProvider()
-        style_provider.load_from_data(NOTEBOOK_STYLE_CSS)
-        Gtk.StyleContext.add_provider_for_screen(
-            Gdk.Screen.get_default(), 
-            style_provider,     
-            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-        )
+        self._init_cells(builder.get_object(CELLS),
+                         builder.get_object(SCROLLED_WINDOW))
+        resources.install_css(NOTEBOOK_STYLE_CSS)
         builder.connect_signals(self)
 
 
@@ -238,11 +310,22 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         #view.modify_font(font_description)
         view.set_border_window_size(Gtk.TextWindowType.BOTTOM, 10)
 
-    def _init_cells(self, cells):
+    def _init_cells(self, cells, scrolled_window):
         self.cells_view = cells
         self.cells_model = CellsModel()
+        self._worksheet = None
+        self._row_height = DEFAULT_ROW_HEIGHT
         cells.set_name(CELLS)
+        self._top_placeholder = CellPlaceholderWidget()
+        cells.pack_start(self._top_placeholder, False, True, 0)
+        self._top_placeholder.show()
         self._add_spacer()
+        self._bottom_placeholder = CellPlaceholderWidget()
+        cells.pack_start(self._bottom_placeholder, False, True, 0)
+        self._bottom_placeholder.show()
+        self._vadjustment = vadjustment = scrolled_window.get_vadjustment()
+        cells.set_focus_vadjustment(vadjustment)
+        vadjustment.connect('value-changed', self.on_notebook_cells_scrolled)
         cells.show()
 
     def _add_spacer(self):
@@ -256,22 +339,33 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         spacer = CellVerticalSpacerWidget(spacer_cb)
         view.pack_start(spacer, expand, fill, 0)
         spacer.show()
+        return spacer
+
+    def _new_cell_widget(self):
+        """
+        Return a new cell widget together with its spacer
+
+        Both are appended to the cells view.
+        """
+        widget = CellWidget(
+            self.on_notebook_cell_key_press_event,
+            self.on_notebook_cell_focus_in_event,
+            self.on_notebook_cell_focus_out_event,
+            self.on_notebook_cell_code_complete,
+            self.presenter.load_elided_output)
+        self.cells_view.pack_start(widget, False, True, 0)
+        return widget, self._add_spacer()
 
     def _resize(self, n_cells):
+        """
+        Create or destroy cell widgets until there are ``n_cells``
+        """
         view = self.cells_view
         model = self.cells_model
-        expand = False
-        fill = True
-        key_cb = self.on_notebook_cell_key_press_event
-        focus_in_cb = self.on_notebook_cell_focus_in_event
-        focus_out_cb = self.on_notebook_cell_focus_out_event
-        complete_cb = self.on_notebook_cell_code_complete
         missing = n_cells - len(model)
         for i in range(missing):
-            c = CellWidget(key_cb, focus_in_cb, focus_out_cb, complete_cb)
-            model.append(c)
-            view.pack_start(c, expand, fill, 0)
-            self._add_spacer()
+            widget, spacer = self._new_cell_widget()
+            model.append(widget)
         if missing < 0:
             delete_cell_from = model[missing]
             cells = view.get_children()
@@ -280,6 +374,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
                 view.remove(cell)
                 if isinstance(cell, CellWidget):
                     model.remove(cell)
+        view.reorder_child(self._bottom_placeholder, -1)
         assert n_cells == len(model)
         assert n_cells == sum(1 for child in view.get_children() if isinstance(child, CellWidget))
         
@@ -292,17 +387,215 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         - ``worksheet`` -- A
           :class:`~sage_notebok.model.worksheet.Worksheet`.
         """
-        self._resize(worksheet.n_cells())
+        if worksheet is self._worksheet:
+            self._bind_rows(self.cells_model.first)
+        else:
+            self._worksheet = worksheet
+            self._bind_rows(0, save_input=False)
+            self._vadjustment.set_value(0)
+        self.cells_view.show()
+
+    def _bind_rows(self, first, save_input=True):
+        """
+        Display the cells starting at position ``first``
+
+        Only the cells in a window around the visible part of the
+        worksheet are displayed by actual cell widgets. The cells
+        before and after the window are replaced by empty space of
+        the estimated height.
+
+        INPUT:
+
+        - ``first`` -- integer. The worksheet position of the first
+          cell in the window.
+
+        - ``save_input`` -- boolean. Whether to save edited input of
+          the recycled widgets.
+        """
+        ws = self._worksheet
+        model = self.cells_model
+        n_cells = ws.n_cells()
+        n_widgets = min(n_cells, WINDOW_ROWS)
+        first = max(0, min(first, n_cells - n_widgets))
+        if save_input:
+            self._save_input()
+        if first != model.first:
+            focus = self.cells_view.get_focus_child()
+            if isinstance(focus, CellWidget):
+                self.window.set_focus(None)
+        self._resize(n_widgets)
+        model.first = first
+        for i, widget in enumerate(model):
+            model.update(widget, ws[first + i])
+        self._update_placeholders()
+
+    def _update_placeholders(self):
+        """
+        Set the height of the space for the cells outside the window
+        """
+        model = self.cells_model
+        n_below = self._worksheet.n_cells() - model.first - len(model)
+        height = self._row_height
+        self._top_placeholder.set_height(model.first * height)
+        self._bottom_placeholder.set_height(n_below * height)
+
+    def _place_widget(self, widget, pos):
+        """
+        Move a cell widget and its spacer to position ``pos`` of the window
+
+        The widget must not be in the cells model.
+        """
         view = self.cells_view
+        children = view.get_children()
+        spacer = children[children.index(widget) + 1]
+        base = children.index(self._top_placeholder) + 2
+        view.reorder_child(widget, base + 2 * pos)
+        view.reorder_child(spacer, base + 2 * pos + 1)
+        self.cells_model.insert(pos, widget)
+
+    def _take_widget(self, pos):
+        """
+        Remove the widget at position ``pos`` of the window from the
+        cells model so it can be reused for another cell
+        """
         model = self.cells_model
-        for widget, cell in zip(model, worksheet):
-            widget.update(cell)
-        view.show()
+        widget = model[pos]
+        self._save_widget_input(widget)
+        model.remove(widget)
+        return widget
+
+    def _destroy_widget(self, widget):
+        view = self.cells_view
+        children = view.get_children()
+        spacer = children[children.index(widget) + 1]
+        view.remove(widget)
+        view.remove(spacer)
+
+    def cell_inserted(self, pos, cell):
+        """
+        Display the new ``cell`` at position ``pos``
+
+        At most one cell widget is created or recycled.
+        """
+        model = self.cells_model
+        local = pos - model.first
+        if local < 0:
+            model.first += 1
+        elif local > len(model):
+            pass
+        elif len(model) < WINDOW_ROWS:
+            widget, spacer = self._new_cell_widget()
+            self._place_widget(widget, local)
+            model.update(widget, cell)
+        else:
+            # recycle the widget at the far end of the window
+            if 2 * local >= len(model):
+                widget = self._take_widget(0)
+                model.first += 1
+                local -= 1
+            else:
+                widget = self._take_widget(len(model) - 1)
+            self._place_widget(widget, local)
+            model.update(widget, cell)
+        self._update_placeholders()
+
+    def cell_deleted(self, pos, cell):
+        """
+        Stop displaying ``cell``, which was at position ``pos``
+
+        The widget is reused for the next cell after the window (or
+        before the window, if at the end of the worksheet).
+        """
+        model = self.cells_model
+        ws = self._worksheet
+        local = pos - model.first
+        if local < 0:
+            model.first -= 1
+        elif local < len(model):
+            widget = model[local]
+            model.remove(widget)
+            below = model.first + len(model)
+            if below < ws.n_cells():
+                self._place_widget(widget, len(model))
+                model.update(widget, ws[below])
+            elif model.first > 0:
+                model.first -= 1
+                self._place_widget(widget, 0)
+                model.update(widget, ws[model.first])
+            else:
+                self._destroy_widget(widget)
+        self._update_placeholders()
+
+    def cell_moved(self, old_pos, new_pos, cell):
+        """
+        Display ``cell`` at ``new_pos`` instead of ``old_pos``
+        """
+        self.cell_deleted(old_pos, cell)
+        self.cell_inserted(new_pos, cell)
+
+    def _save_input(self):
+        """
+        Save edited input before the widgets are recycled
+        """
+        for widget in self.cells_model:
+            self._save_widget_input(widget)
+
+    def _save_widget_input(self, widget):
+        ws = self._worksheet
+        if widget.id is None or not ws.has_cell_id(widget.id):
+            return
+        input_string = widget.get_input()
+        if input_string != ws.get_cell(widget.id).input:
+            self.presenter.set_cell_input(widget.id, input_string)
+
+    def _show_row(self, row):
+        """
+        Make sure that the cell at position ``row`` has a widget
+        """
+        model = self.cells_model
+        if not model.first <= row < model.first + len(model):
+            self._bind_rows(row - WINDOW_ROWS // 2)
+
+    def _find_widget(self, cell):
+        """
+        Return the widget displaying ``cell`` or ``None`` if the cell
+        is not in the displayed window.
+        """
+        try:
+            return self.cells_model.find(cell)
+        except IndexError:
+            return None
+
+    def on_notebook_cells_scrolled(self, adjustment):
+        """
+        Move the window of cell widgets when scrolling past its end
+        """
+        model = self.cells_model
+        if self._worksheet is None or len(model) == 0:
+            return
+        first = model.first
+        last = first + len(model)
+        top = self._top_placeholder.get_allocation()
+        window_start = top.y + top.height
+        window_end = self._bottom_placeholder.get_allocation().y
+        if window_end > window_start:
+            self._row_height = (window_end - window_start) / float(len(model))
+        height = self._row_height
+        value = adjustment.get_value()
+        if value < window_start and first > 0:
+            top_row = first - (window_start - value) / height
+        elif value + adjustment.get_page_size() > window_end and \
+             last < self._worksheet.n_cells():
+            top_row = last + (value - window_end) / height
+        else:
+            return
+        self._bind_rows(int(top_row) - OVERSCAN)
 
     def cell_grab_focus(self, cell):
         """
         Focus and place cursor into cell input area
         """
+        self._show_row(self._worksheet.index(cell))
         widget = self.cells_model.find(cell)
         if widget is self.cells_view.get_focus_child():
             return
@@ -316,24 +609,28 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         """
         self.toolbutton_stop.set_sensitive(True)
         self.toolbutton_spinner.start()
-        widget = self.cells_model.find(cell)
-        widget.set_output(cell)
-        widget.set_sensitive(False)
+        widget = self._find_widget(cell)
+        if widget is not None:
+            widget.set_output(cell)
+            widget.set_sensitive(False)
 
     def cell_update(self, cell):
         """
         Update the view of the cell to display a (potentially partial) result.
         """
-        widget = self.cells_model.find(cell)
-        widget.set_output(cell)
+        widget = self._find_widget(cell)
+        if widget is not None:
+            widget.append_output(cell)
         
     def cell_finished(self, cell):
         """
         Update the view of the cell to display the final result
         """
-        widget = self.cells_model.find(cell)
-        widget.set_output(cell)
-        widget.set_sensitive(True)
+        widget = self._find_widget(cell)
+        if widget is not None:
+            widget.set_index(cell.index)
+            widget.append_output(cell)
+            widget.set_sensitive(True)
         self.toolbutton_stop.set_sensitive(False)
         self.toolbutton_spinner.stop()
         
@@ -363,10 +660,9 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         input_string = cell.get_input()
         self.on_notebook_evaluate_cell(cell_id, input_string)
         # Move cursor to the next cell, insert one if necessary
-        cells = self.cells_model
-        next_widget = cells.find_next_sensitive(cell)
+        next_widget = self._find_sensitive(cell, 1)
         if next_widget is None:
-            pos = len(cells)
+            pos = self._worksheet.n_cells()
             self.presenter.insert_cell_at(pos)
         else:
             next_widget.in_view.grab_focus()
@@ -375,6 +671,26 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
             buf.place_cursor(cursor)
         return True
 
+    def _find_sensitive(self, widget, step):
+        """
+        Find the next (``step=1``) or previous (``step=-1``) sensitive
+        cell widget, moving the window of cell widgets if necessary.
+        """
+        model = self.cells_model
+        if step > 0:
+            finder = model.find_next_sensitive
+        else:
+            finder = model.find_prev_sensitive
+        result = finder(widget)
+        if result is not None:
+            return result
+        row = model.row(widget) + step
+        if not 0 <= row < self._worksheet.n_cells():
+            return None
+        cell_id = widget.id
+        self._show_row(row)
+        return finder(model.find_id(cell_id))
+
     def on_notebook_cell_focus_in_event(self, widget, event):
         """
         Callback: Notebook cell got focused
@@ -394,7 +710,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         self.menu_cell_delete.set_sensitive(False)
 
     def on_notebook_spacer_button_press_event(self, widget, event):
-        pos = 0
+        pos = self.cells_model.first
         for child in self.cells_view.get_children():
             if isinstance(child, CellWidget):
                 pos += 1
@@ -407,7 +723,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         x, y = cell.get_cursor_position()
         if not (y == 0):
             return False
-        prev_cell = self.cells_model.find_prev_sensitive(cell)
+        prev_cell = self._find_sensitive(cell, -1)
         if prev_cell is None:
             return False
         prev_cell.in_view.grab_focus()
@@ -421,7 +737,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         x, y = cell.get_cursor_position()
         if not y == cell.in_buffer.get_line_count() - 1:
             return False
-        next_cell = self.cells_model.find_next_sensitive(cell)
+        next_cell = self._find_sensitive(cell, 1)
         if next_cell is None:
             return False
         next_cell.in_view.grab_focus()
@@ -439,7 +755,9 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         """
         Update the view to display completions
         """
-        widget = self.cells_model.find(cell)
+        widget = self._find_widget(cell)
+        if widget is None:
+            return
         c = completion
         widget.show_code_completions(c.base, c.completions, c.request.label)
 
@@ -457,19 +775,61 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         return self._start_evaluate_cell(focus)
 
     def on_notebook_toolbutton_stop_clicked(self, widget, data=None):
-        self.presenter.show_notification(self, "todo: stop")
+        self.presenter.evaluate_interrupt()
 
     def on_notebook_menu_new_activate(self, widget, data=None):
-        self.presenter.show_notification(self, "todo: new")
+        self.presenter.new_worksheet()
+
+    def _run_file_chooser(self, title, action, button):
+        """
+        Ask for a worksheet file name
+
+        OUTPUT:
+
+        String or ``None`` if the dialog was cancelled.
+        """
+        dialog = Gtk.FileChooserDialog(
+            title, self.window, action,
+            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+             button, Gtk.ResponseType.ACCEPT))
+        file_filter = Gtk.FileFilter()
+        file_filter.set_name('Sage worksheets')
+        extension = self.presenter.get_worksheet_extension()
+        file_filter.add_pattern('*' + extension)
+        dialog.add_filter(file_filter)
+        filename = self.presenter.get_worksheet_filename()
+        if filename is None:
+            dialog.set_current_folder(self.presenter.get_notebooks_directory())
+        else:
+            dialog.set_filename(filename)
+        if action == Gtk.FileChooserAction.SAVE:
+            dialog.set_do_overwrite_confirmation(True)
+            if filename is None:
+                dialog.set_current_name('Untitled' + extension)
+        try:
+            if dialog.run() != Gtk.ResponseType.ACCEPT:
+                return None
+            return dialog.get_filename()
+        finally:
+            dialog.destroy()
 
     def on_notebook_menu_open_activate(self, widget, data=None):
-        self.presenter.show_notification(self, "todo: open")
+        filename = self._run_file_chooser(
+            'Open Worksheet', Gtk.FileChooserAction.OPEN, Gtk.STOCK_OPEN)
+        if filename is not None:
+            self.presenter.open_worksheet(filename)
 
     def on_notebook_menu_save_activate(self, widget, data=None):
-        self.presenter.show_notification(self, "todo: save")
+        if self.presenter.get_worksheet_filename() is None:
+            self.on_notebook_menu_saveas_activate(widget, data)
+        else:
+            self.presenter.save_worksheet()
 
     def on_notebook_menu_saveas_activate(self, widget, data=None):
-        self.presenter.show_notification(self, "todo: save as")
+        filename = self._run_file_chooser(
+            'Save Worksheet', Gtk.FileChooserAction.SAVE, Gtk.STOCK_SAVE)
+        if filename is not None:
+            self.presenter.save_worksheet(filename)
 
     def on_notebook_menu_quit_activate(self, widget, data=None):
         self.presenter.hide_notebook_window()
@@ -478,7 +838,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         focus = self.cells_view.get_focus_child()
         if not isinstance(focus, CellWidget):
             return False
-        pos = self.cells_model.index(focus)
+        pos = self.cells_model.row(focus)
         self.presenter.insert_cell_at(pos)
 
     def on_notebook_menu_insert_after_activate(self, widget, data=None):
@@ -488,7 +848,7 @@ class NotebookWindowGtk(NotebookWindowABC, WindowGtk):
         focus = self.cells_view.get_focus_child()
         if not isinstance(focus, CellWidget):
             return False
-        pos = self.cells_model.index(focus)
+        pos = self.cells_model.row(focus)
         self.presenter.insert_cell_at(pos+1)
 
     def on_notebook_menu_cell_delete_activate(self, widget, data=None):
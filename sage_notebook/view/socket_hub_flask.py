@@ -0,0 +1,160 @@
+"""
+Websocket Connection Hub
+
+Every browser tab that shows a window opens its own websocket. The hub
+keeps track of all of them and sends each message to every connected
+client.
+
+Each client has a bounded queue of outgoing messages that is emptied
+by its own greenlet. Broadcasting only puts the message into the
+queues, so it never blocks the caller (typically a compute service
+callback) even if a client reads slowly. A client whose queue is full
+has fallen too far behind to catch up message by message: its queue
+is dropped and it is sent a single resync message instead, after which
+it has to reload the state of the window.
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import logging
+logger = logging.getLogger('GUI')
+
+import gevent
+from gevent.queue import Queue, Full
+from geventwebsocket import WebSocketError
+
+
+# Queue markers for the sender greenlet
+_RESYNC = object()
+_CLOSE = object()
+
+
+class SocketClient(object):
+
+    def __init__(self, hub, ws, maxsize):
+        """
+        A connected websocket
+
+        INPUT:
+
+        - ``hub`` -- the :class:`SocketHub`.
+
+        - ``ws`` -- the websocket.
+
+        - ``maxsize`` -- integer. The maximal number of queued
+          messages.
+        """
+        self.hub = hub
+        self.ws = ws
+        self._queue = Queue(maxsize)
+        self._greenlet = gevent.spawn(self._send_loop)
+
+    def put(self, message):
+        """
+        Queue the message for sending without blocking
+        """
+        try:
+            self._queue.put_nowait(message)
+        except Full:
+            logger.info('websocket client is lagging, resync')
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(_RESYNC)
+
+    def close(self):
+        """
+        Stop sending after the queued messages
+        """
+        try:
+            self._queue.put_nowait(_CLOSE)
+        except Full:
+            self._greenlet.kill(block=False)
+
+    def _send_loop(self):
+        while True:
+            message = self._queue.get()
+            if message is _CLOSE:
+                return
+            if message is _RESYNC:
+                message = self.hub.resync_message(self)
+            try:
+                self.ws.send(message)
+            except WebSocketError:
+                logger.debug('websocket closed while sending')
+                return
+
+
+class SocketHub(object):
+
+    def __init__(self, resync_message, maxsize=256):
+        """
+        The websockets connected to one window
+
+        INPUT:
+
+        - ``resync_message`` -- callable. Takes the
+          :class:`SocketClient` as argument and returns the message
+          for a client that fell behind.
+
+        - ``maxsize`` -- integer. The maximal number of messages that
+          are queued for a client before it has to resync.
+        """
+        self._resync_message = resync_message
+        self._maxsize = maxsize
+        self._clients = []
+
+    def __len__(self):
+        return len(self._clients)
+
+    def connect(self, ws):
+        """
+        Add a websocket
+
+        OUTPUT:
+
+        The :class:`SocketClient`. Pass it to :meth:`disconnect` when
+        the websocket is closed.
+        """
+        client = SocketClient(self, ws, self._maxsize)
+        self._clients.append(client)
+        logger.debug('websocket connected, %s clients', len(self._clients))
+        return client
+
+    def disconnect(self, client):
+        """
+        Remove a websocket
+        """
+        self._clients.remove(client)
+        client.close()
+        logger.debug('websocket disconnected, %s clients', len(self._clients))
+
+    def broadcast(self, message):
+        """
+        Send the message to all connected websockets
+
+        Messages are silently dropped if nobody is connected.
+        """
+        for client in self._clients:
+            client.put(message)
+
+    def resync_message(self, client):
+        """
+        Return the message for a client that fell behind
+        """
+        return self._resync_message(client)
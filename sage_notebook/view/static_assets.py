@@ -0,0 +1,318 @@
+"""
+Fingerprinted and Precompressed Static Files
+
+The static files of the web interface (javascript, style sheets and
+images) rarely change. The build step copies each of them to a name
+that contains a hash of its content, for example
+``js/notebook.3f2a9c1be0d4.js``. Browsers can cache such a file
+forever, since a changed file gets a new name. Text files are also
+compressed with gzip (and brotli, if the ``brotli`` module is
+installed), so that the server only has to send the precompressed
+bytes. The mapping from the original to the fingerprinted names is
+saved in ``manifest.json``.
+
+Run the build step with::
+
+    python -m sage_notebook.view.static_assets
+
+EXAMPLES::
+
+    sage: import os, tempfile
+    sage: from sage_notebook.view.static_assets import build, Manifest
+    sage: source = tempfile.mkdtemp()
+    sage: os.mkdir(os.path.join(source, 'js'))
+    sage: with open(os.path.join(source, 'js', 'app.js'), 'w') as f:
+    ....:     _ = f.write('alert(1);\\n' * 100)
+    sage: target = tempfile.mkdtemp()
+    sage: manifest = build(source, target)
+    sage: manifest.url('js/app.js')
+    'js/app.1d6d71d537e1.js'
+    sage: manifest.url('css/missing.css')
+    'css/missing.css'
+    sage: sorted(f for f in os.listdir(os.path.join(target, 'js')) if not f.endswith('.br'))
+    ['app.1d6d71d537e1.js', 'app.1d6d71d537e1.js.gz']
+    sage: Manifest.load(target, source).url('js/app.js')
+    'js/app.1d6d71d537e1.js'
+    sage: manifest.is_fingerprinted('js/app.1d6d71d537e1.js')
+    True
+    sage: manifest.path('js/app.1d6d71d537e1.js', 'gzip;q=0')[1] is None
+    True
+    sage: manifest.path('js/app.1d6d71d537e1.js', 'br;q=0, gzip')[1]
+    'gzip'
+
+A build that does not match the static files any more is ignored::
+
+    sage: with open(os.path.join(source, 'js', 'app.js'), 'w') as f:
+    ....:     _ = f.write('alert(2);\\n')
+    sage: import logging
+    sage: logging.getLogger('GUI').disabled = True    # silence the warning
+    sage: Manifest.load(target, source).url('js/app.js')
+    'js/app.js'
+    sage: logging.getLogger('GUI').disabled = False
+    sage: import shutil
+    sage: shutil.rmtree(source); shutil.rmtree(target)
+"""
+
+##############################################################################
+#  Sage Notebook: A Graphical User Interface for Sage
+#  Copyright (C) 2013  Volker Braun <vbraun.name@gmail.com>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+
+import os
+import json
+import gzip
+import hashlib
+import shutil
+import logging
+logger = logging.getLogger('GUI')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+STATIC_DIRECTORY = os.path.join(os.path.dirname(__file__), 'flask', 'static')
+BUILD_DIRECTORY = os.path.join(os.path.dirname(__file__), 'flask', 'build')
+
+MANIFEST = 'manifest.json'
+
+# Only these are worth compressing, images are compressed already
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.txt', '.json')
+
+# Content codings of the precompressed files, preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(data):
+    """
+    Return the hash of the file content that goes into the file name
+    """
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Return the content codings that a client accepts
+
+    INPUT:
+
+    - ``accept_encoding`` -- string. The ``Accept-Encoding`` header
+      of the request.
+
+    OUTPUT:
+
+    The list of the codings in :data:`ENCODINGS` that are not refused
+    by a quality value of zero, in order of preference.
+
+    EXAMPLES::
+
+        sage: from sage_notebook.view.static_assets import accepted_encodings
+        sage: accepted_encodings('gzip, deflate, br')
+        ['br', 'gzip']
+        sage: accepted_encodings('br;q=0, gzip;q=0.5')
+        ['gzip']
+        sage: accepted_encodings('*;q=0.1, gzip;q=0')
+        ['br']
+        sage: accepted_encodings('gzip;q=0.0, br;q=0.000')
+        []
+    """
+    qualities = dict()
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    default = qualities.get('*', 0.0)
+    return [coding for coding, suffix in ENCODINGS
+            if qualities.get(coding, default) > 0]
+
+
+def _write(filename, data):
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+def _gzip(data):
+    import io
+    buf = io.BytesIO()
+    # fixed mtime, so that rebuilding gives identical files
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _static_files(source):
+    """
+    Iterate over the static files
+
+    OUTPUT:
+
+    Triples consisting of the name (relative to ``source``, separated
+    by ``/``), the fingerprinted name, and the file content.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            root, ext = os.path.splitext(name)
+            yield (name, '{0}.{1}{2}'.format(root, fingerprint(data), ext), data)
+
+
+def build(source=STATIC_DIRECTORY, target=BUILD_DIRECTORY):
+    """
+    Fingerprint and compress the static files
+
+    INPUT:
+
+    - ``source`` -- string. The directory with the static files.
+
+    - ``target`` -- string. The output directory. Its previous
+      content is deleted.
+
+    OUTPUT:
+
+    The :class:`Manifest` of the build.
+    """
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    files = dict()
+    for name, hashed, data in _static_files(source):
+        files[name] = hashed
+        output = os.path.join(target, *hashed.split('/'))
+        if not os.path.isdir(os.path.dirname(output)):
+            os.makedirs(os.path.dirname(output))
+        _write(output, data)
+        if os.path.splitext(name)[1] not in COMPRESSIBLE:
+            continue
+        _write(output + '.gz', _gzip(data))
+        if brotli is not None:
+            _write(output + '.br', brotli.compress(data))
+    manifest = Manifest(target, files)
+    manifest.save()
+    logger.info('built %s static files in %s', len(files), target)
+    return manifest
+
+
+class Manifest(object):
+
+    def __init__(self, directory, files):
+        """
+        The fingerprinted names of the static files
+
+        INPUT:
+
+        - ``directory`` -- string. The build directory.
+
+        - ``files`` -- dictionary. The original file names (relative
+          to the static directory, separated by ``/``) as keys, the
+          fingerprinted names as values.
+        """
+        self.directory = directory
+        self._files = dict(files)
+        self._hashed = frozenset(self._files.values())
+
+    @classmethod
+    def load(cls, directory=BUILD_DIRECTORY, source=STATIC_DIRECTORY):
+        """
+        Read the manifest of a previous build
+
+        INPUT:
+
+        - ``directory`` -- string. The build directory.
+
+        - ``source`` -- string. The directory with the static files.
+          The build is only used if it matches their content.
+
+        OUTPUT:
+
+        The manifest. If there is no build, or the static files were
+        changed after the build, an empty manifest is returned and all
+        static files are served unchanged.
+        """
+        try:
+            with open(os.path.join(directory, MANIFEST)) as f:
+                files = json.load(f)
+        except (IOError, OSError, ValueError):
+            files = dict()
+        if files:
+            current = dict((name, hashed) for name, hashed, data in _static_files(source))
+            if current != files:
+                logger.warning('static files changed since the last build, '
+                               'serving them without fingerprints; rebuild with '
+                               'python -m sage_notebook.view.static_assets')
+                files = dict()
+        return cls(directory, files)
+
+    def save(self):
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(self._files, f, indent=1, sort_keys=True)
+
+    def __len__(self):
+        return len(self._files)
+
+    def url(self, name):
+        """
+        Return the fingerprinted name of a static file
+
+        The name is returned unchanged if the file was not built.
+        """
+        return self._files.get(name, name)
+
+    def is_fingerprinted(self, name):
+        """
+        Whether ``name`` is the fingerprinted name of a built file
+        """
+        return name in self._hashed
+
+    def path(self, name, accept_encoding=''):
+        """
+        Return the file to send for a fingerprinted name
+
+        INPUT:
+
+        - ``name`` -- string. A fingerprinted name.
+
+        - ``accept_encoding`` -- string. The ``Accept-Encoding``
+          header of the request, see :func:`accepted_encodings`.
+
+        OUTPUT:
+
+        A pair consisting of the file name and the content coding
+        (``None`` if the file is not compressed).
+        """
+        path = os.path.join(self.directory, *name.split('/'))
+        accepted = accepted_encodings(accept_encoding)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.exists(path + suffix):
+                return (path + suffix, coding)
+        return (path, None)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    build()
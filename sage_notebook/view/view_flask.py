@@ -23,10 +23,13 @@ This is the Gtk3 implementation of :mod:`view`.
 ##############################################################################
 
 import os
+import mimetypes
+import flask
 from flask import Flask
 
 from .view import ViewABC
 from .window_flask import WindowFlask
+from .static_assets import Manifest, STATIC_DIRECTORY
 from sage_notebook.misc.cached_property import cached_property
 
 
@@ -35,18 +38,52 @@ class ViewFlask(ViewABC):
     
     def __init__(self, presenter):
         super(ViewFlask, self).__init__(presenter)
-        static = os.path.join('flask', 'static')
         template = os.path.join('flask', 'templates')
-        self._app = app = Flask(__name__, static_folder=static, template_folder=template) 
+        self._app = app = Flask(__name__, static_folder=None, template_folder=template) 
         app.config['DEBUG'] = True
+        self._assets = Manifest.load()
+        app.jinja_env.globals['asset_url'] = self.asset_url
         self._init_routes()
 
     def _init_routes(self):
         """
         Set up the Flask URL routing
         """
+        self.flask_app.add_url_rule('/static/<path:filename>', 'static', self.dispatch_static)
         self.notebook_window.add_url_rule_to(self.flask_app)
 
+    def asset_url(self, filename):
+        """
+        Return the url of a static file
+
+        Use this in templates instead of ``url_for('static', ...)``
+        to get the fingerprinted file, see
+        :mod:`~sage_notebook.view.static_assets`.
+        """
+        return flask.url_for('static', filename=self._assets.url(filename))
+
+    def dispatch_static(self, filename):
+        """
+        Serve a static file
+
+        Fingerprinted files never change, so they are sent
+        precompressed (if the browser accepts it) and with headers
+        that allow caching forever. Other files, for example images
+        referenced by relative urls in style sheets, are served from
+        the static directory and revalidated by the browser.
+        """
+        if not self._assets.is_fingerprinted(filename):
+            return flask.send_from_directory(STATIC_DIRECTORY, filename)
+        accept_encoding = flask.request.headers.get('Accept-Encoding', '')
+        path, coding = self._assets.path(filename, accept_encoding)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = flask.send_file(path, mimetype=mimetype, conditional=True)
+        if coding is not None:
+            response.headers['Content-Encoding'] = coding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
     @property
     def flask_app(self):
         """
@@ -35,6 +35,7 @@ import flask
 from geventwebsocket import WebSocketError
 
 from .window import WindowABC, ModalDialogABC
+from .socket_hub_flask import SocketHub
 
 
 class WindowFlask(WindowABC):
@@ -103,10 +104,6 @@ class WindowFlask(WindowABC):
 
 
 
-class SocketDisconnectedException(Exception):
-    pass
-
-
 class WindowFlaskSocket(WindowFlask):
     """
     Flask + Websocket Window
@@ -117,7 +114,7 @@ class WindowFlaskSocket(WindowFlask):
         Web page + Websocket
         """
         super(WindowFlaskSocket, self).__init__(name, presenter, *args)
-        self._ws = None
+        self._hub = SocketHub(self.resync_message)
 
     @property
     def url_socket(self):
@@ -137,12 +134,35 @@ class WindowFlaskSocket(WindowFlask):
 
     def send(self, message):
         """
-        Send a message on the websocket.
+        Send a message on all connected websockets.
+
+        Does not block. The message is dropped if no websocket is
+        connected.
         """
-        if self._ws is None:
-            raise SocketDisconnectedException()
         logger.debug('Sending websocket message: %s', message)
-        self._ws.send(message)
+        self._hub.broadcast(message)
+
+    def resync_message(self, client):
+        """
+        Return the message for a websocket that fell behind
+
+        You should override this method to tell the client to reload.
+        """
+        raise NotImplementedError
+
+    def on_connect(self, client):
+        """
+        Callback for a new websocket connection
+
+        INPUT:
+
+        - ``client`` -- a
+          :class:`~sage_notebook.view.socket_hub_flask.SocketClient`. Its
+          ``put()`` method sends a message to this websocket only.
+
+        You can override this method to bring the client up to date.
+        """
+        pass
 
     def on_receive(self, message):
         """
@@ -155,9 +175,16 @@ class WindowFlaskSocket(WindowFlask):
     def dispatch_socket(self):
         req = flask.request
         if req.environ.get('wsgi.websocket'):
-            self._ws = ws = req.environ['wsgi.websocket']
+            ws = req.environ['wsgi.websocket']
             logger.debug('Opening websocket')
-            self.dispatch_socket_read_loop(ws)
+            client = self._hub.connect(ws)
+            try:
+                self.on_connect(client)
+                self.dispatch_socket_read_loop(ws)
+            except WebSocketError:
+                pass
+            finally:
+                self._hub.disconnect(client)
             logger.debug('Closing websocket')
             return flask.Response()
         else:
@@ -47,6 +47,17 @@ def test_worksheet_model():
     
 def run_doctests():
     testmod('sage_notebook.test.doctest_parser')
+    testmod('sage_notebook.model.compute_session')
+    testmod('sage_notebook.model.compute_queue')
+    testmod('sage_notebook.model.code_completion')
+    testmod('sage_notebook.misc.update_batcher')
+    testmod('sage_notebook.misc.order_statistic_tree')
+    testmod('sage_notebook.model.output_buffer')
+    testmod('sage_notebook.model.worksheet')
+    testmod('sage_notebook.model.worksheet_file')
+    testmod('sage_notebook.model.worksheet_journal')
+    testmod('sage_notebook.view.notebook_protocol')
+    testmod('sage_notebook.view.static_assets')
     #test_worksheet_model()
 
 